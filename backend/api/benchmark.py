@@ -0,0 +1,199 @@
+"""Helpers shared by the ``bench_*`` management commands.
+
+Benchmarks never touch the configured database: they run against a
+throw-away test database (SQLite or PostgreSQL, whatever ``DATABASES``
+points at) that is created before seeding and destroyed afterwards.
+The configured replicas mirror it, so the reads the router sends to
+them see the seeded rows and are measured like any other.
+"""
+import contextlib
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from rest_framework.authtoken.models import Token
+
+from recipes import counters, feed, shopping_list
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientsInRecipe,
+    Recipe,
+    ShoppingCart,
+)
+from users.models import Follow, User
+
+
+@contextlib.contextmanager
+def scratch_database(verbosity=0):
+    setup_test_environment(debug=False)
+    mirrors = {}
+    for alias in settings.DATABASE_REPLICAS:
+        test_settings = connections[alias].settings_dict['TEST']
+        mirrors[alias] = test_settings.get('MIRROR')
+        test_settings['MIRROR'] = DEFAULT_DB_ALIAS
+    try:
+        old_config = setup_databases(
+            verbosity=verbosity,
+            interactive=False,
+            aliases={DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS},
+        )
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=verbosity)
+    finally:
+        for alias, mirror in mirrors.items():
+            connections[alias].settings_dict['TEST']['MIRROR'] = mirror
+        teardown_test_environment()
+
+
+@contextlib.contextmanager
+def capture_queries():
+    """Collect the queries run on every database, replicas included,
+    into the yielded list once the block ends."""
+    queries = []
+    with contextlib.ExitStack() as stack:
+        contexts = [
+            stack.enter_context(CaptureQueriesContext(connections[alias]))
+            for alias in connections
+        ]
+        yield queries
+    for context in contexts:
+        queries.extend(context.captured_queries)
+
+
+def seed_users(count, prefix='bench'):
+    User.objects.bulk_create(
+        User(
+            email=f'{prefix}{number}@example.com',
+            username=f'{prefix}{number}',
+            first_name='Bench',
+            last_name=str(number),
+        ) for number in range(count)
+    )
+    return list(User.objects.filter(username__startswith=prefix))
+
+
+def seed_ingredients(count):
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'ingredient {number:06}', measurement_unit='г')
+        for number in range(count)
+    )
+    return list(Ingredient.objects.values_list('id', flat=True))
+
+
+def seed_recipes(authors, count, ingredient_ids, per_recipe=8, seed=0):
+    """Create ``count`` recipes spread over ``authors``."""
+    rng = random.Random(seed)
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=authors[number % len(authors)],
+            name=f'Recipe {number}',
+            text='Bench recipe text. ' * 10,
+            image='recipes/bench.png',
+            cooking_time=rng.randint(1, 120),
+            ingredients_count=min(per_recipe, len(ingredient_ids)),
+        ) for number in range(count)
+    )
+    recipe_ids = list(
+        Recipe.objects.order_by('-id').values_list('id', flat=True)[:count]
+    )
+    IngredientsInRecipe.objects.bulk_create(
+        (
+            IngredientsInRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids, min(per_recipe, len(ingredient_ids))
+            )
+        ),
+        batch_size=5000,
+    )
+    return recipe_ids
+
+
+def seed_relations(users, recipe_ids, favorites=0, carts=0, follows=0,
+                   seed=0):
+    """Give every user random favourites, cart recipes and follows."""
+    rng = random.Random(seed)
+    Favorite.objects.bulk_create(
+        (
+            Favorite(user=user, recipe_id=recipe_id)
+            for user in users
+            for recipe_id in rng.sample(
+                recipe_ids, min(favorites, len(recipe_ids))
+            )
+        ),
+        batch_size=5000,
+    )
+    ShoppingCart.objects.bulk_create(
+        (
+            ShoppingCart(user=user, recipe_id=recipe_id)
+            for user in users
+            for recipe_id in rng.sample(
+                recipe_ids, min(carts, len(recipe_ids))
+            )
+        ),
+        batch_size=5000,
+    )
+    Follow.objects.bulk_create(
+        (
+            Follow(user=user, following=author)
+            for user in users
+            for author in rng.sample(users, min(follows, len(users)))
+            if author != user
+        ),
+        batch_size=5000,
+    )
+    shopping_list.rebuild()
+    feed.rebuild()
+    for start in range(0, len(recipe_ids), 1000):
+        counters.reconcile(recipe_ids[start:start + 1000])
+
+
+def auth_header(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    return {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+
+def measure(func, repeat):
+    """Call ``func`` ``repeat`` times and return timing stats in ms."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(timings):
+    return {
+        'min': min(timings),
+        'p50': statistics.median(timings),
+        'p95': percentile(timings, 0.95),
+        'p99': percentile(timings, 0.99),
+        'max': max(timings),
+    }
+
+
+def format_stats(stats):
+    return '  '.join(f'{key}={value:8.2f}ms' for key, value in stats.items())
@@ -0,0 +1,166 @@
+"""Validators for conditional GET of recipe pages.
+
+A recipe page depends on the recipes themselves, on their authors'
+profiles, on the ingredients and on the requesting user's favourites,
+cart and follows. Each of these scopes has a "changed at" timestamp in
+the cache that is moved forward after a change is committed; ETag and
+Last-Modified are derived from the timestamps, so a 304 can be answered
+before any serialization happens. A timestamp that fell out of the
+cache is restarted at the current time, which only costs clients one
+refetch.
+
+Each timestamp is also written to ``ChangeStamp`` on the primary once
+the cache holds it, and so reaches the replicas after the change it
+stands for. A request keeps reading from its replica only when the
+replica's stamps are as new as the cache's; otherwise the page would
+be cached by clients under validators newer than its content.
+
+The favourite and cart counters shown on list pages change with every
+click of any user. Their scope is "settled": the validators move
+forward at most once per ``COUNTERS_REFRESH_INTERVAL`` seconds, after
+the counters changed, so the counters lag behind by at most that long,
+plus the replication lag: replicas are not waited for on their account.
+"""
+import math
+import time
+from functools import partial
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from . import replicas
+from .models import ChangeStamp
+
+RECIPES = 'recipes'
+AUTHORS = 'authors'
+INGREDIENTS = 'ingredients'
+COUNTERS = 'counters'
+
+
+def get_user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def _get_key(scope):
+    return f'changed-at:{scope}'
+
+
+def touch(*scopes):
+    """Move the timestamps of ``scopes`` forward once the transaction
+    commits."""
+    transaction.on_commit(partial(_touch_now, scopes))
+
+
+def _touch_now(scopes):
+    now = time.time()
+    cache.set_many({_get_key(scope): now for scope in scopes}, None)
+    _store({scope: now for scope in scopes})
+
+
+def _store(stamps):
+    # Outside the router, so that nothing counts as the request's write.
+    ChangeStamp.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+        [
+            ChangeStamp(scope=scope, changed_at=changed_at)
+            for scope, changed_at in stamps.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['scope'],
+        update_fields=['changed_at'],
+    )
+
+
+def get_changed_at(scopes):
+    """Timestamps of ``scopes`` and the scopes among them that were
+    restarted."""
+    keys = {scope: _get_key(scope) for scope in scopes}
+    values = cache.get_many(keys.values())
+    changed_at = {}
+    restarted = []
+    for scope, key in keys.items():
+        if key not in values:
+            if cache.add(key, time.time(), None):
+                restarted.append(scope)
+            values[key] = cache.get(key)
+        changed_at[scope] = values[key]
+    return changed_at, restarted
+
+
+def _follow_replica(changed_at, restarted):
+    """Keep the request's reads on its replica only if the replica has
+    caught up with ``changed_at``."""
+    replica = replicas.get_replica()
+    if replica is None:
+        return
+    if restarted:
+        _store({scope: changed_at[scope] for scope in restarted})
+    replicated = dict(
+        ChangeStamp.objects.using(replica).filter(
+            scope__in=changed_at
+        ).values_list('scope', 'changed_at')
+    )
+    if any(
+        replicated.get(scope, -math.inf) < value
+        for scope, value in changed_at.items()
+    ):
+        replicas.use_primary()
+
+
+def settle(changed_at, now):
+    """``changed_at`` moved to the end of its refresh interval once the
+    interval is over, and to its start until then."""
+    interval = settings.COUNTERS_REFRESH_INTERVAL
+    return min(
+        math.ceil(changed_at / interval) * interval,
+        math.floor(now / interval) * interval,
+    )
+
+
+def get_stamps(request, scopes, settled=()):
+    """Timestamps of ``scopes`` and of the user's relations, and of the
+    ``settled`` scopes passed through ``settle``.
+
+    The request's remaining reads go to a database that has caught up
+    with the unsettled ones, so that the body matches the validators.
+    """
+    if request.user.is_authenticated:
+        scopes = [*scopes, get_user_scope(request.user.pk)]
+    changed_at, restarted = get_changed_at(scopes)
+    _follow_replica(changed_at, restarted)
+    settled_at, _ = get_changed_at(settled)
+    now = time.time()
+    for scope, value in settled_at.items():
+        changed_at[scope] = settle(value, now)
+    return changed_at
+
+
+def get_validators(request, stamps, timestamps=(), key=''):
+    """ETag and Last-Modified (a POSIX timestamp) for the request from
+    the ``stamps`` of ``get_stamps`` and the ``timestamps`` of the
+    objects shown."""
+    last_modified = max([*stamps.values(), *timestamps])
+    etag = md5(
+        f'{key}:{request.user.pk}:{sorted(stamps.items())}:'
+        f'{timestamps}'.encode()
+    ).hexdigest()
+    return quote_etag(etag), int(last_modified)
+
+
+def conditional_response(request, etag, last_modified, view):
+    """Answer 304 when the client's copy is current, otherwise call
+    ``view`` and attach the validators to its response."""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = view()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Authorization',))
+    return response
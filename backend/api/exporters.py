@@ -0,0 +1,76 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+
+from rest_framework import renderers
+
+
+class ShoppingListRenderer(renderers.BaseRenderer, ABC):
+    """Base class of the shopping list download formats.
+
+    The list itself is produced lazily by ``stream`` and sent with a
+    ``StreamingHttpResponse``; ``render`` is only used for error payloads.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        return str(data).encode(self.charset)
+
+    @abstractmethod
+    def stream(self, rows):
+        """Chunks of the list of ``(name, unit, amount)`` ``rows``."""
+
+
+class TXTShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        separator = ''
+        for name, unit, amount in rows:
+            yield f"{separator}{name} - {amount} ({unit})"
+            separator = '\n'
+
+
+class Echo:
+    """File-like object that hands written lines back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class JSONShoppingListRenderer(renderers.JSONRenderer, ShoppingListRenderer):
+    """Error payloads are rendered as JSON, not as text."""
+    format = 'json'
+    charset = 'utf-8'
+
+    def stream(self, rows):
+        separator = '['
+        for name, unit, amount in rows:
+            yield separator + json.dumps(
+                {'name': name, 'measurement_unit': unit, 'amount': amount},
+                ensure_ascii=False,
+                separators=(',', ':'),
+            )
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_RENDERERS = (
+    TXTShoppingListRenderer,
+    CSVShoppingListRenderer,
+    JSONShoppingListRenderer,
+)
@@ -1,5 +1,12 @@
 import django_filters
-from recipes.models import Recipe, Favorite, ShoppingCart, Ingredient
+from rest_framework.filters import OrderingFilter
+from recipes.models import Recipe, Favorite, ShoppingCart
+from recipes.coverage import exclude_ingredients, filter_by_ingredients
+from recipes.search import search_recipes
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    pass
 
 
 class RecipeFilter(django_filters.FilterSet):
@@ -17,10 +24,24 @@ class RecipeFilter(django_filters.FilterSet):
         choices=((0, 'False'), (1, 'True')),
         coerce=lambda x: bool(int(x)),
     )
+    search = django_filters.CharFilter(method='filter_search')
+    ingredients = NumberInFilter(method='filter_ingredients')
+    missing = django_filters.NumberFilter(
+        method='filter_missing', min_value=0
+    )
+    exclude_ingredients = NumberInFilter(method='filter_exclude_ingredients')
 
     class Meta:
         model = Recipe
-        fields = ['author', 'is_favorited', 'is_in_shopping_cart']
+        fields = [
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'search',
+            'ingredients',
+            'missing',
+            'exclude_ingredients',
+        ]
 
     def init(self, data=None, queryset=None, *, request=None, prefix=None):
         super().init(
@@ -38,6 +59,22 @@ class RecipeFilter(django_filters.FilterSet):
             )
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ingredients(self, queryset, name, value):
+        missing = self.form.cleaned_data.get('missing')
+        return filter_by_ingredients(
+            queryset, value, int(missing) if missing else 0
+        )
+
+    def filter_missing(self, queryset, name, value):
+        # Only qualifies the ingredients filter.
+        return queryset
+
+    def filter_exclude_ingredients(self, queryset, name, value):
+        return exclude_ingredients(queryset, value)
+
     def filter_in_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
             return queryset.filter(
@@ -47,12 +84,18 @@ class RecipeFilter(django_filters.FilterSet):
         return queryset
 
 
-class IngredientFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith',
-    )
+class RecipeOrderingFilter(OrderingFilter):
+    """``?ordering=-favorites_count`` and the like; ties keep the default
+    newest-first order."""
 
-    class Meta:
-        model = Ingredient
-        fields = ['name']
+    ordering_fields = ('favorites_count', 'in_carts_count', 'created')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering:
+            fields = {field.lstrip('-') for field in ordering}
+            ordering = [*ordering, *(
+                field for field in Recipe._meta.ordering
+                if field.lstrip('-') not in fields
+            )]
+        return ordering
@@ -0,0 +1,147 @@
+"""Responsive variants of uploaded images.
+
+The request only stores the original upload. Once the transaction
+commits, a worker pool decodes it, applies and drops EXIF, and writes a
+WebP file per size from ``settings.IMAGE_VARIANTS`` next to it. The
+names are kept in ``<field>_variants`` together with the original they
+were made from (``source``), so a replaced image is detected by a
+mismatch and the stale variants are never served: until the new ones
+are ready the serializers fall back to the original.
+"""
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+from users.models import User
+
+from . import conditional
+
+logger = logging.getLogger(__name__)
+
+# Model -> (image field, conditional scope of the pages showing it).
+IMAGE_FIELDS = {
+    Recipe: ('image', conditional.RECIPES),
+    User: ('avatar', conditional.AUTHORS),
+}
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            settings.IMAGE_WORKERS, thread_name_prefix='images'
+        )
+    return _executor
+
+
+def get_variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def get_variant_names(name, variants):
+    """Names of the ready variants of the image stored as ``name``."""
+    if not name or variants.get('source') != name:
+        return {}
+    return {size: variants[size] for size in settings.IMAGE_VARIANTS}
+
+
+def schedule(instance):
+    """Process the instance's image after the transaction commits."""
+    field_name, _ = IMAGE_FIELDS[type(instance)]
+    name = getattr(instance, field_name).name or ''
+    variants = getattr(instance, get_variants_field(field_name))
+    if variants.get('source', '') == name:
+        return
+    job = partial(process, type(instance), instance.pk)
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: _get_executor().submit(_run_in_worker, job)
+        )
+    else:
+        transaction.on_commit(job)
+
+
+def _run_in_worker(job):
+    try:
+        job()
+    finally:
+        connection.close()
+
+
+def delete_files(variants):
+    for size in settings.IMAGE_VARIANTS:
+        if variants.get(size):
+            default_storage.delete(variants[size])
+
+
+def render(image, box):
+    variant = image.copy()
+    variant.thumbnail((box, box), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    variant.save(
+        buffer, 'WEBP', quality=settings.IMAGE_WEBP_QUALITY, method=4
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def make_variants(name):
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        # Rotates the pixels as EXIF says; the tag itself is not copied
+        # to the variants, and neither is the rest of the metadata.
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert(
+            'RGBA' if image.has_transparency_data else 'RGB'
+        )
+    stem = posixpath.splitext(name)[0]
+    variants = {'source': name}
+    for size, box in settings.IMAGE_VARIANTS.items():
+        variants[size] = default_storage.save(
+            f'{stem}.{size}.webp', render(image, box)
+        )
+    return variants
+
+
+def process(model, pk):
+    """Bring the variants of the object's image in line with it."""
+    field_name, scope = IMAGE_FIELDS[model]
+    variants_field = get_variants_field(field_name)
+    try:
+        row = model.objects.filter(pk=pk).values(field_name, variants_field)
+        row = row.first()
+        if row is None:
+            return
+        name, old = row[field_name] or '', row[variants_field]
+        if old.get('source', '') == name:
+            return
+        new = make_variants(name) if name else {}
+        changes = {variants_field: new}
+        if model is Recipe:
+            changes['updated'] = timezone.now()
+        # Filtering on the image makes a job that lost the race with a
+        # newer upload a no-op; the newer job produces its own variants.
+        same_image = Q(**{field_name: name})
+        if not name:
+            same_image |= Q(**{f'{field_name}__isnull': True})
+        if model.objects.filter(same_image, pk=pk).update(**changes):
+            delete_files(old)
+            conditional.touch(scope)
+        else:
+            delete_files(new)
+    except Exception:
+        logger.exception('Image variants of %s %s failed', model, pk)
@@ -0,0 +1,546 @@
+import json
+import re
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+
+from api.benchmark import (
+    auth_header,
+    capture_queries,
+    scratch_database,
+    seed_ingredients,
+    seed_recipes,
+    seed_relations,
+    seed_users,
+    summarize,
+)
+from api.urls import router
+from recipes import similarity
+from recipes.models import Recipe
+from users.models import User
+
+PASSWORD = 'bench-password'
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+
+
+@dataclass
+class Scenario:
+    """One measured operation: a few requests made back to back."""
+    name: str
+    url_names: tuple
+    steps: tuple
+    unsafe: bool = False
+
+
+@dataclass
+class Result:
+    timings: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    statements: list = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0
+
+
+def fetch(client, path, headers):
+    return client.get(path, **headers)
+
+
+def send_json(client, method, path, data, headers):
+    return getattr(client, method)(
+        path, json.dumps(data), content_type='application/json', **headers
+    )
+
+
+def download(client, path, headers):
+    response = client.get(path, **headers)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def make_png(color):
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def upload_raw(client, path, content, headers):
+    return client.put(path, content, content_type='image/png', **headers)
+
+
+def upload_form(client, path, field_name, content, headers):
+    return client.put(
+        path,
+        encode_multipart(BOUNDARY, {
+            field_name: SimpleUploadedFile(
+                'bench.png', content, content_type='image/png'
+            ),
+        }),
+        content_type=MULTIPART_CONTENT,
+        **headers,
+    )
+
+
+def recipe_payload(ctx):
+    return {
+        'name': 'Bench recipe',
+        'text': 'Bench recipe text.',
+        'cooking_time': 10,
+        'image': IMAGE,
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in ctx['ingredient_ids'][:5]
+        ],
+    }
+
+
+def create_and_delete_recipe(client, ctx):
+    response = send_json(
+        client, 'post', '/api/recipes/', recipe_payload(ctx), ctx['auth']
+    )
+    if response.status_code != 201:
+        return response
+    return client.delete(
+        f'/api/recipes/{response.json()["id"]}/', **ctx['auth']
+    )
+
+
+def login_and_logout(client, ctx):
+    response = send_json(
+        client, 'post', '/api/auth/token/login/',
+        {'email': ctx['login_email'], 'password': PASSWORD}, {},
+    )
+    if response.status_code != 200:
+        return response
+    return client.post(
+        '/api/auth/token/logout/',
+        HTTP_AUTHORIZATION=f'Token {response.json()["auth_token"]}',
+    )
+
+
+SCENARIOS = (
+    Scenario('ingredients: поиск', ('ingredient-list',), (
+        lambda c, ctx: fetch(c, '/api/ingredients/?name=ingredient 0001',
+                                ctx['auth']),
+    )),
+    Scenario('ingredients: один', ('ingredient-detail',), (
+        lambda c, ctx: fetch(
+            c, f'/api/ingredients/{ctx["ingredient_ids"][0]}/', ctx['auth']
+        ),
+    )),
+    Scenario('recipes: список (аноним)', ('recipe-list',), (
+        lambda c, ctx: fetch(c, '/api/recipes/', {}),
+    )),
+    Scenario('recipes: список limit=50', ('recipe-list',), (
+        lambda c, ctx: fetch(c, '/api/recipes/?limit=50', ctx['auth']),
+    )),
+    Scenario('recipes: избранное', ('recipe-list',), (
+        lambda c, ctx: fetch(c, '/api/recipes/?is_favorited=1',
+                                ctx['auth']),
+    )),
+    Scenario('recipes: по ингредиентам', ('recipe-list',), (
+        lambda c, ctx: fetch(
+            c,
+            '/api/recipes/?missing=2&ingredients='
+            + ','.join(map(str, ctx['ingredient_ids'][:15])),
+            ctx['auth'],
+        ),
+    )),
+    Scenario('recipes: популярные', ('recipe-list',), (
+        lambda c, ctx: fetch(c, '/api/recipes/?ordering=-favorites_count',
+                                ctx['auth']),
+    )),
+    Scenario('recipes: курсор', ('recipe-list',), (
+        lambda c, ctx: fetch(c, '/api/recipes/?cursor=&limit=50',
+                                ctx['auth']),
+    )),
+    Scenario('recipes: один', ('recipe-detail',), (
+        lambda c, ctx: fetch(c, f'/api/recipes/{ctx["recipe_id"]}/',
+                                ctx['auth']),
+    )),
+    Scenario('recipes: лента', ('recipe-feed',), (
+        lambda c, ctx: fetch(c, '/api/recipes/feed/', ctx['auth']),
+    )),
+    Scenario('recipes: похожие', ('recipe-similar',), (
+        lambda c, ctx: fetch(
+            c, f'/api/recipes/{ctx["recipe_id"]}/similar/', ctx['auth']
+        ),
+    )),
+    Scenario('recipes: get-link', ('recipe-get-link',), (
+        lambda c, ctx: fetch(
+            c, f'/api/recipes/{ctx["recipe_id"]}/get-link/', ctx['auth']
+        ),
+    )),
+    Scenario('recipes: скачать список', ('recipe-download_shopping_cart',), (
+        lambda c, ctx: download(c, '/api/recipes/download_shopping_cart/',
+                                ctx['auth']),
+    )),
+    Scenario('recipes: создать + удалить', ('recipe-list', 'recipe-detail'), (
+        create_and_delete_recipe,
+    ), unsafe=True),
+    Scenario('recipes: изменить', ('recipe-detail',), (
+        lambda c, ctx: send_json(
+            c, 'patch', f'/api/recipes/{ctx["own_recipe_id"]}/',
+            recipe_payload(ctx), ctx['auth'],
+        ),
+    ), unsafe=True),
+    # Two different images, so that neither upload is skipped as the
+    # file the recipe already has.
+    Scenario('recipes: картинка', ('recipe-image',), (
+        lambda c, ctx: upload_raw(
+            c, f'/api/recipes/{ctx["own_recipe_id"]}/image/',
+            ctx['images'][0], ctx['auth'],
+        ),
+        lambda c, ctx: upload_form(
+            c, f'/api/recipes/{ctx["own_recipe_id"]}/image/', 'image',
+            ctx['images'][1], ctx['auth'],
+        ),
+    ), unsafe=True),
+    Scenario('recipes: в избранное и обратно', ('recipe-favorite',), (
+        lambda c, ctx: c.post(
+            f'/api/recipes/{ctx["target_recipe_id"]}/favorite/', **ctx['auth']
+        ),
+        lambda c, ctx: c.delete(
+            f'/api/recipes/{ctx["target_recipe_id"]}/favorite/', **ctx['auth']
+        ),
+    ), unsafe=True),
+    Scenario('recipes: неделя в избранное', ('recipe-favorite-batch',), (
+        lambda c, ctx: send_json(
+            c, 'post', '/api/recipes/favorite/batch/',
+            {'recipes': ctx['meal_plan']}, ctx['auth'],
+        ),
+        lambda c, ctx: send_json(
+            c, 'delete', '/api/recipes/favorite/batch/',
+            {'recipes': ctx['meal_plan']}, ctx['auth'],
+        ),
+    ), unsafe=True),
+    Scenario('recipes: неделя в корзину', ('recipe-shopping_cart-batch',), (
+        lambda c, ctx: send_json(
+            c, 'post', '/api/recipes/shopping_cart/batch/',
+            {'recipes': ctx['meal_plan']}, ctx['auth'],
+        ),
+        lambda c, ctx: send_json(
+            c, 'delete', '/api/recipes/shopping_cart/batch/',
+            {'recipes': ctx['meal_plan']}, ctx['auth'],
+        ),
+    ), unsafe=True),
+    Scenario('recipes: в корзину и обратно', ('recipe-shopping_cart',), (
+        lambda c, ctx: c.post(
+            f'/api/recipes/{ctx["target_recipe_id"]}/shopping_cart/',
+            **ctx['auth'],
+        ),
+        lambda c, ctx: c.delete(
+            f'/api/recipes/{ctx["target_recipe_id"]}/shopping_cart/',
+            **ctx['auth'],
+        ),
+    ), unsafe=True),
+    Scenario('users: список', ('user-list',), (
+        lambda c, ctx: fetch(c, '/api/users/', ctx['auth']),
+    )),
+    Scenario('users: один', ('user-detail',), (
+        lambda c, ctx: fetch(c, f'/api/users/{ctx["author_id"]}/',
+                                ctx['auth']),
+    )),
+    Scenario('users: me', ('user-me',), (
+        lambda c, ctx: fetch(c, '/api/users/me/', ctx['auth']),
+    )),
+    Scenario('users: подписки', ('user-subscriptions',), (
+        lambda c, ctx: fetch(
+            c, '/api/users/subscriptions/?recipes_limit=3', ctx['auth']
+        ),
+    )),
+    Scenario('users: подписаться и отписаться', ('user-subscribe',), (
+        lambda c, ctx: c.post(
+            f'/api/users/{ctx["target_user_id"]}/subscribe/', **ctx['auth']
+        ),
+        lambda c, ctx: c.delete(
+            f'/api/users/{ctx["target_user_id"]}/subscribe/', **ctx['auth']
+        ),
+    ), unsafe=True),
+    Scenario('users: аватар', ('user-avatar',), (
+        lambda c, ctx: send_json(c, 'put', '/api/users/me/avatar/',
+                                 {'avatar': IMAGE}, ctx['auth']),
+        lambda c, ctx: c.delete('/api/users/me/avatar/', **ctx['auth']),
+    ), unsafe=True),
+    Scenario('users: смена пароля', ('user-set-password',), (
+        lambda c, ctx: send_json(
+            c, 'post', '/api/users/set_password/',
+            {'current_password': PASSWORD, 'new_password': PASSWORD},
+            ctx['auth'],
+        ),
+    ), unsafe=True),
+    Scenario('auth: вход и выход', ('login', 'logout'), (
+        login_and_logout,
+    ), unsafe=True),
+)
+
+LITERALS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\((?:\?, )+\?\)'), '(...)'),
+)
+
+
+def get_template(sql):
+    for pattern, replacement in LITERALS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер всех эндпоинтов API на временной базе данных: '
+        'перцентили задержки, запросы к БД, пропускная способность и '
+        'планы запросов, со сравнением с сохранённым эталоном.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=20)
+        parser.add_argument('--carts', type=int, default=5)
+        parser.add_argument('--follows', type=int, default=10)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Операций на эндпоинт.',
+        )
+        parser.add_argument(
+            '--only', help='Только сценарии, в названии которых есть строка.'
+        )
+        parser.add_argument('--output', help='Куда сохранить JSON отчёта.')
+        parser.add_argument('--baseline', help='JSON эталона для сравнения.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95 относительно эталона (0.2 = 20%%).',
+        )
+
+    def handle(self, *args, **options):
+        self.check_coverage()
+        if options['users'] < 2 * options['threads'] + 2:
+            raise CommandError('Нужно хотя бы 2 * threads + 2 пользователей.')
+        # Password endpoints are measured without the cost of the real
+        # hasher, and uploaded images go to a temporary directory.
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+            MEDIA_ROOT=media_root,
+        ), scratch_database():
+            contexts = self.seed(options)
+            report = self.run(contexts, options)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['tolerance'])
+
+    def check_coverage(self):
+        url_names = {url.name for url in router.urls} - {'api-root'}
+        url_names |= {'login', 'logout'}
+        covered = {
+            name for scenario in SCENARIOS for name in scenario.url_names
+        }
+        for name in sorted(url_names - covered):
+            self.stderr.write(f'Эндпоинт {name} не покрыт сценариями.')
+
+    def seed(self, options):
+        start = time.perf_counter()
+        users = seed_users(options['users'])
+        User.objects.filter(pk__in=[user.pk for user in users]).update(
+            password=make_password(PASSWORD)
+        )
+        ingredient_ids = seed_ingredients(options['ingredients'])
+        recipe_ids = seed_recipes(
+            users, options['recipes'], ingredient_ids,
+            per_recipe=options['per_recipe'],
+        )
+        for offset in range(0, len(recipe_ids), 1000):
+            similarity.update(recipe_ids[offset:offset + 1000])
+        target_user = users[-1]
+        seed_relations(
+            users[:-1], recipe_ids,
+            favorites=options['favorites'],
+            carts=options['carts'],
+            follows=options['follows'],
+        )
+        own_recipes = dict(
+            Recipe.objects.filter(pk__in=recipe_ids)
+            .order_by('author_id', 'id')
+            .values_list('author_id', 'id')
+        )
+        # A week of meals to add in one request.
+        meal_plan = recipe_ids[-21:]
+        images = (make_png('red'), make_png('blue'))
+        contexts = []
+        for number in range(options['threads']):
+            user = users[number]
+            contexts.append({
+                'auth': auth_header(user),
+                'ingredient_ids': ingredient_ids,
+                'recipe_id': recipe_ids[number % len(recipe_ids)],
+                'own_recipe_id': own_recipes[user.pk],
+                'target_recipe_id': own_recipes[target_user.pk],
+                'meal_plan': meal_plan,
+                'images': images,
+                'author_id': target_user.pk,
+                'target_user_id': target_user.pk,
+                'login_email': users[options['threads'] + number].email,
+            })
+        self.dataset = {
+            key: options[key] for key in (
+                'users', 'recipes', 'ingredients', 'per_recipe',
+                'favorites', 'carts', 'follows',
+            )
+        }
+        self.stdout.write(
+            f'Данные подготовлены за {time.perf_counter() - start:.1f} с.'
+        )
+        return contexts
+
+    def run(self, contexts, options):
+        endpoints, statements = {}, {}
+        self.stdout.write(
+            f'{"сценарий":<34} {"опер.":>6} {"ошибки":>6} {"p50":>8} '
+            f'{"p95":>8} {"p99":>8} {"опер/с":>8} {"запр.":>6}'
+        )
+        for scenario in SCENARIOS:
+            if options['only'] and options['only'] not in scenario.name:
+                continue
+            threads = options['threads']
+            if scenario.unsafe and connection.vendor == 'sqlite':
+                # SQLite serializes writers; concurrent writes would only
+                # measure lock waits.
+                threads = 1
+            result = self.run_scenario(
+                scenario, contexts[:threads], options['requests']
+            )
+            stats = summarize(result.timings)
+            endpoints[scenario.name] = {
+                'operations': len(result.timings),
+                'errors': result.errors,
+                'p50': stats['p50'],
+                'p95': stats['p95'],
+                'p99': stats['p99'],
+                'throughput': len(result.timings) / result.elapsed,
+                # The median ignores the odd cold-cache request, so the
+                # figure stays stable enough to compare against a baseline.
+                'queries': statistics.median(result.queries),
+                'max_queries': max(result.queries),
+            }
+            for sql in result.statements:
+                statements.setdefault(get_template(sql), sql)
+            row = endpoints[scenario.name]
+            self.stdout.write(
+                f'{scenario.name:<34} {row["operations"]:>6} '
+                f'{row["errors"]:>6} {row["p50"]:>6.1f}ms '
+                f'{row["p95"]:>6.1f}ms {row["p99"]:>6.1f}ms '
+                f'{row["throughput"]:>8.1f} {row["queries"]:>6.1f}'
+            )
+        return {
+            'database': connection.vendor,
+            'dataset': self.dataset,
+            'threads': options['threads'],
+            'endpoints': endpoints,
+            'plans': self.explain(statements),
+        }
+
+    def run_scenario(self, scenario, contexts, operations):
+        per_thread = max(1, operations // len(contexts))
+
+        def work(ctx):
+            client = Client()
+            result = Result()
+            try:
+                for _ in range(per_thread):
+                    start = time.perf_counter()
+                    with capture_queries() as queries:
+                        for step in scenario.steps:
+                            response = step(client, ctx)
+                            if response.status_code >= 400:
+                                result.errors += 1
+                    result.timings.append(
+                        (time.perf_counter() - start) * 1000
+                    )
+                    result.queries.append(len(queries))
+                    result.statements.extend(
+                        query['sql'] for query in queries
+                    )
+            finally:
+                connections.close_all()
+            return result
+
+        total = Result()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(len(contexts)) as pool:
+            for result in pool.map(work, contexts):
+                total.timings += result.timings
+                total.queries += result.queries
+                total.statements += result.statements
+                total.errors += result.errors
+        total.elapsed = time.perf_counter() - start
+        return total
+
+    def explain(self, statements):
+        prefix = (
+            'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite'
+            else 'EXPLAIN '
+        )
+        plans = {}
+        for template, sql in sorted(statements.items()):
+            if not sql.lstrip().upper().startswith(
+                ('SELECT', 'UPDATE', 'DELETE')
+            ):
+                continue
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(prefix + sql)
+                    plan = '\n'.join(
+                        ' '.join(str(column) for column in row)
+                        for row in cursor.fetchall()
+                    )
+            except Exception as error:
+                plan = f'не удалось получить план: {error}'
+            plans[template] = {'example': sql, 'plan': plan}
+        return plans
+
+    def compare(self, report, path, tolerance):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, row in report['endpoints'].items():
+            base = baseline['endpoints'].get(name)
+            if base is None:
+                self.stdout.write(f'{name}: нет в эталоне')
+                continue
+            if row['queries'] > base['queries']:
+                regressions.append(
+                    f'{name}: запросов {base["queries"]:.1f} -> '
+                    f'{row["queries"]:.1f}'
+                )
+            if row['p95'] > base['p95'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p95 {base["p95"]:.1f}ms -> {row["p95"]:.1f}ms'
+                )
+        new_plans = report['plans'].keys() - baseline.get('plans', {}).keys()
+        for template in sorted(new_plans):
+            self.stdout.write(f'Новый запрос: {template}')
+        for line in regressions:
+            self.stderr.write(line)
+        if regressions:
+            raise CommandError(f'Регрессий: {len(regressions)}.')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
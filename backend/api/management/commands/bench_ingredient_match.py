@@ -0,0 +1,116 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, Q
+
+from api.benchmark import (
+    format_stats,
+    measure,
+    scratch_database,
+    seed_ingredients,
+    seed_recipes,
+    seed_users,
+)
+from recipes.coverage import filter_by_ingredients
+from recipes.models import IngredientsInRecipe, Recipe
+
+PAGE_SIZE = 6
+
+
+def naive(ingredient_ids, missing):
+    """Counts the matching and all ingredients of every recipe."""
+    return Recipe.objects.annotate(
+        total=Count('recipeinlist'),
+        matched=Count(
+            'recipeinlist',
+            filter=Q(recipeinlist__ingredient__in=ingredient_ids),
+        ),
+    ).filter(
+        matched__gt=0, total__lte=F('matched') + missing
+    ).order_by(
+        F('total') - F('matched'), '-matched', *Recipe._meta.ordering
+    )
+
+
+def first_page(queryset):
+    """What the recipe list does: a count and one page of ids."""
+    return (
+        queryset.count(),
+        list(queryset.values_list('id', flat=True)[:PAGE_SIZE]),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает подбор рецептов по имеющимся ингредиентам через '
+        'индекс ингредиент -> рецепты с наивным ingredients__in + Count.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=10)
+        parser.add_argument(
+            '--have', type=int, default=15,
+            help='Сколько ингредиентов есть у пользователя.',
+        )
+        parser.add_argument('--missing', type=int, nargs='+',
+                            default=[0, 1, 2])
+        parser.add_argument('--sets', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with scratch_database():
+            start = time.perf_counter()
+            authors = seed_users(10)
+            ingredient_ids = seed_ingredients(options['ingredients'])
+            recipe_ids = seed_recipes(
+                authors, options['recipes'], ingredient_ids,
+                per_recipe=options['per_recipe'],
+            )
+            self.stdout.write(
+                f'Рецептов: {len(recipe_ids)}, строк ингредиентов: '
+                f'{IngredientsInRecipe.objects.count()} '
+                f'({time.perf_counter() - start:.1f} с)'
+            )
+            for number in range(options['sets']):
+                # Most of one recipe's ingredients plus a few random ones,
+                # so that every level of ``missing`` finds something.
+                recipe_ingredients = list(
+                    IngredientsInRecipe.objects.filter(
+                        recipe_id=rng.choice(recipe_ids)
+                    ).values_list('ingredient_id', flat=True)
+                )
+                have = set(recipe_ingredients[:-1])
+                while len(have) < options['have']:
+                    have.add(rng.choice(ingredient_ids))
+                have = sorted(have)
+                for missing in options['missing']:
+                    expected = first_page(naive(have, missing))
+                    actual = first_page(
+                        filter_by_ingredients(
+                            Recipe.objects.all(), have, missing
+                        )
+                    )
+                    if actual != expected:
+                        raise CommandError(
+                            f'Результаты расходятся: {actual} != {expected}'
+                        )
+                    naive_stats = measure(
+                        lambda: first_page(naive(have, missing)),
+                        options['repeat'],
+                    )
+                    index_stats = measure(
+                        lambda: first_page(filter_by_ingredients(
+                            Recipe.objects.all(), have, missing
+                        )),
+                        options['repeat'],
+                    )
+                    self.stdout.write(
+                        f'набор {number}, missing={missing}, '
+                        f'найдено {expected[0]}:\n'
+                        f'  наивный {format_stats(naive_stats)}\n'
+                        f'  индекс  {format_stats(index_stats)}'
+                    )
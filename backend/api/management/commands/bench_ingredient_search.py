@@ -0,0 +1,54 @@
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.benchmark import format_stats, measure, scratch_database
+from api.serializers import IngredientSerializer
+from recipes.catalog import ingredient_catalog
+from recipes.models import Ingredient
+
+PREFIXES = ('а', 'кар', 'мол', 'сы', 'томатн', 'я')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск ингредиентов по префиксу через ORM '
+        'и через индекс в памяти.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=settings.BASE_DIR.parent / 'data' / 'ingredients.csv',
+        )
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            with open(options['file'], encoding='utf-8') as file:
+                Ingredient.objects.bulk_create(
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in csv.reader(file)
+                )
+            ingredient_catalog.refresh()
+            self.stdout.write(
+                f'Ингредиентов: {Ingredient.objects.count()}'
+            )
+            for prefix in PREFIXES:
+                orm = measure(
+                    lambda: IngredientSerializer(
+                        Ingredient.objects.filter(name__istartswith=prefix),
+                        many=True,
+                    ).data,
+                    options['repeat'],
+                )
+                memory = measure(
+                    lambda: ingredient_catalog.search(prefix),
+                    options['repeat'],
+                )
+                self.stdout.write(
+                    f'{prefix!r}:\n'
+                    f'  ORM    {format_stats(orm)}\n'
+                    f'  память {format_stats(memory)}'
+                )
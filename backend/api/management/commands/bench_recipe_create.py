@@ -0,0 +1,150 @@
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+
+from api.benchmark import (
+    auth_header,
+    format_stats,
+    measure,
+    scratch_database,
+    seed_ingredients,
+    seed_users,
+)
+from api.serializers import (
+    IngredientsInRecipeCreateSerializer,
+    RecipeCreateSerializer,
+)
+from recipes.catalog import ingredient_catalog
+from recipes.models import Ingredient, Recipe
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+
+
+class NaiveIngredientSerializer(IngredientsInRecipeCreateSerializer):
+    """The ingredient looked up by a query per item."""
+    id = serializers.PrimaryKeyRelatedField(
+        queryset=Ingredient.objects.all(),
+        source='ingredient',
+    )
+
+    class Meta(IngredientsInRecipeCreateSerializer.Meta):
+        list_serializer_class = serializers.ListSerializer
+
+
+class NaiveRecipeSerializer(RecipeCreateSerializer):
+    ingredients = NaiveIngredientSerializer(many=True)
+
+
+def payload(ingredient_ids):
+    return {
+        'name': 'Bench recipe',
+        'text': 'Bench recipe text.',
+        'cooking_time': 10,
+        'image': IMAGE,
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in ingredient_ids
+        ],
+    }
+
+
+def validate(serializer_class, data):
+    serializer = serializer_class(data=data)
+    serializer.is_valid(raise_exception=True)
+
+
+def count_queries(func):
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет проверку и создание рецепта в зависимости от числа '
+        'ингредиентов: поиск ингредиентов запросом на каждый, одним '
+        'запросом и по каталогу в памяти.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[5, 10, 20, 40, 80])
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root
+        ), scratch_database():
+            author, = seed_users(1)
+            ingredient_ids = seed_ingredients(options['ingredients'])
+            client = Client()
+            headers = auth_header(author)
+            # Measured first: until something refreshes it, the catalog
+            # is not built and ids are resolved with one query.
+            cold = {}
+            for size in options['sizes']:
+                data = payload(ingredient_ids[:size])
+                cold[size] = (
+                    measure(
+                        lambda: validate(RecipeCreateSerializer, data),
+                        repeat,
+                    ),
+                    count_queries(
+                        lambda: validate(RecipeCreateSerializer, data)
+                    ),
+                )
+            ingredient_catalog.refresh()
+            for size in options['sizes']:
+                data = payload(ingredient_ids[:size])
+                rows = {
+                    'по запросу на каждый': (
+                        measure(
+                            lambda: validate(NaiveRecipeSerializer, data),
+                            repeat,
+                        ),
+                        count_queries(
+                            lambda: validate(NaiveRecipeSerializer, data)
+                        ),
+                    ),
+                    'одним запросом': cold[size],
+                    'по каталогу': (
+                        measure(
+                            lambda: validate(RecipeCreateSerializer, data),
+                            repeat,
+                        ),
+                        count_queries(
+                            lambda: validate(RecipeCreateSerializer, data)
+                        ),
+                    ),
+                    'POST /api/recipes/': (
+                        measure(
+                            lambda: client.post(
+                                '/api/recipes/', data,
+                                content_type='application/json', **headers
+                            ),
+                            repeat,
+                        ),
+                        count_queries(
+                            lambda: client.post(
+                                '/api/recipes/', data,
+                                content_type='application/json', **headers
+                            )
+                        ),
+                    ),
+                }
+                self.stdout.write(f'Ингредиентов в рецепте: {size}')
+                for name, (stats, queries) in rows.items():
+                    self.stdout.write(
+                        f'  {name:<22}{format_stats(stats)}  '
+                        f'запросов={queries}'
+                    )
+            self.stdout.write(f'Создано рецептов: {Recipe.objects.count()}')
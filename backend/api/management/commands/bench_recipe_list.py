@@ -0,0 +1,126 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api import representations
+from api.benchmark import (
+    auth_header,
+    format_stats,
+    measure,
+    scratch_database,
+    seed_ingredients,
+    seed_recipes,
+    seed_relations,
+    seed_users,
+)
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeSerializer
+from recipes.models import IngredientsInRecipe, Recipe
+
+
+def render_serialized(request, size):
+    recipes = Recipe.objects.defer('search_vector').select_related(
+        'author'
+    ).prefetch_related(Prefetch(
+        'recipeinlist',
+        queryset=IngredientsInRecipe.objects.select_related(
+            'ingredient'
+        ).order_by('id'),
+    ))[:size]
+    return JSONRenderer().render(
+        RecipeSerializer(recipes, many=True, context={'request': request}).data
+    )
+
+
+def render_rows(request, size):
+    rows = Recipe.objects.values(*representations.RECIPE_FIELDS)[:size]
+    return FastJSONRenderer().render(
+        representations.get_recipes(rows, {'request': request})
+    )
+
+
+def count_queries(func):
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает выдачу страницы рецептов через RecipeSerializer и '
+        'JSONRenderer с выдачей из строк values() через orjson и '
+        'проверяет, что ответы совпадают байт в байт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[6, 50, 100])
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        with scratch_database():
+            users = seed_users(options['users'])
+            ingredient_ids = seed_ingredients(options['ingredients'])
+            recipe_ids = seed_recipes(
+                users, options['recipes'], ingredient_ids,
+                per_recipe=options['per_recipe'],
+            )
+            seed_relations(
+                users, recipe_ids, favorites=50, carts=10, follows=20
+            )
+            viewer = users[0]
+            request = Request(RequestFactory().get('/api/recipes/'))
+            request.user = viewer
+            client = Client()
+            headers = auth_header(viewer)
+            for size in options['sizes']:
+                serialized = render_serialized(request, size)
+                if serialized != render_rows(request, size):
+                    self.stderr.write(
+                        f'Ответы различаются на странице из {size}'
+                    )
+                rows = {
+                    'RecipeSerializer': (
+                        measure(
+                            lambda: render_serialized(request, size), repeat
+                        ),
+                        count_queries(
+                            lambda: render_serialized(request, size)
+                        ),
+                    ),
+                    'values() + orjson': (
+                        measure(lambda: render_rows(request, size), repeat),
+                        count_queries(lambda: render_rows(request, size)),
+                    ),
+                    'GET /api/recipes/': (
+                        measure(
+                            lambda: client.get(
+                                f'/api/recipes/?limit={size}', **headers
+                            ),
+                            repeat,
+                        ),
+                        count_queries(
+                            lambda: client.get(
+                                f'/api/recipes/?limit={size}', **headers
+                            )
+                        ),
+                    ),
+                }
+                self.stdout.write(
+                    f'Рецептов на странице: {size}, '
+                    f'размер ответа: {len(serialized)} байт'
+                )
+                for name, (stats, queries) in rows.items():
+                    self.stdout.write(
+                        f'  {name:<20}{format_stats(stats)}  '
+                        f'запросов={queries}'
+                    )
@@ -0,0 +1,79 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from api.benchmark import (
+    auth_header,
+    format_stats,
+    scratch_database,
+    seed_ingredients,
+    seed_recipes,
+    seed_users,
+    summarize,
+)
+from recipes import shopping_list
+from recipes.models import ShoppingCart
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер скачивания списка покупок для корзины из тысяч рецептов '
+        'на временной базе данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=3000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user, = seed_users(1)
+            ingredient_ids = seed_ingredients(options['ingredients'])
+            recipe_ids = seed_recipes(
+                [user], options['recipes'], ingredient_ids,
+                per_recipe=options['per_recipe'],
+            )
+            ShoppingCart.objects.bulk_create(
+                ShoppingCart(user=user, recipe_id=recipe_id)
+                for recipe_id in recipe_ids
+            )
+            # bulk_create sends no signals to keep the aggregate up.
+            shopping_list.rebuild([user.id])
+            self.stdout.write(
+                f'Корзина: {len(recipe_ids)} рецептов, '
+                f'{options["per_recipe"]} ингредиентов в каждом.'
+            )
+            client = Client(**auth_header(user))
+            for export_format in ('txt', 'csv', 'json'):
+                self.run_format(client, export_format, options['repeat'])
+
+    def run_format(self, client, export_format, repeat):
+        url = f'/api/recipes/download_shopping_cart/?format={export_format}'
+        first_byte, total, sizes = [], [], []
+        tracemalloc.start()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{url}: ответ {response.status_code}: '
+                    f'{response.content.decode()[:200]}'
+                )
+            chunks = iter(response.streaming_content)
+            size = len(next(chunks))
+            first_byte.append((time.perf_counter() - start) * 1000)
+            size += sum(len(chunk) for chunk in chunks)
+            total.append((time.perf_counter() - start) * 1000)
+            sizes.append(size)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{export_format}: {sizes[0]} байт, '
+            f'пик памяти {peak / 1024:.0f} КБ\n'
+            f'  первый байт {format_stats(summarize(first_byte))}\n'
+            f'  целиком     {format_stats(summarize(total))}'
+        )
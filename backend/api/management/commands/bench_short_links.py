@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from api import shortlinks
+from api.benchmark import (
+    scratch_database,
+    seed_ingredients,
+    seed_recipes,
+    seed_users,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает число запросов в секунду для короткой ссылки: полный '
+        'DRF-рецепт против редиректа.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            users = seed_users(20)
+            recipe_ids = seed_recipes(
+                users, options['recipes'], seed_ingredients(200)
+            )
+            client = Client()
+            targets = {
+                'DRF retrieve (прежний /s/<pk>/)': [
+                    f'/api/recipes/{pk}/' for pk in recipe_ids
+                ],
+                'редирект /s/<pk>/': [f'/s/{pk}/' for pk in recipe_ids],
+                'редирект /r/<code>/': [
+                    f'/r/{shortlinks.encode(pk)}/' for pk in recipe_ids
+                ],
+            }
+            for title, urls in targets.items():
+                count = options['requests']
+                start = time.perf_counter()
+                for number in range(count):
+                    client.get(urls[number % len(urls)])
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{title}: {count / elapsed:.0f} запросов/с'
+                )
@@ -0,0 +1,157 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, FloatField
+from django.db.models.functions import Cast
+
+from api.benchmark import (
+    format_stats,
+    measure,
+    scratch_database,
+    seed_ingredients,
+    seed_recipes,
+    seed_users,
+)
+from recipes import similarity
+from recipes.models import IngredientsInRecipe, Recipe
+
+
+def exact(recipe_id, limit):
+    """Jaccard index against every recipe sharing an ingredient."""
+    ingredient_ids = list(
+        IngredientsInRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', flat=True)
+    )
+    return list(
+        Recipe.objects.filter(
+            recipeinlist__ingredient_id__in=ingredient_ids
+        ).exclude(pk=recipe_id).annotate(
+            shared=Count('recipeinlist'),
+            similarity=Cast('shared', FloatField()) / (
+                F('ingredients_count') + len(ingredient_ids) - F('shared')
+            ),
+        ).order_by('-similarity', '-id').values_list(
+            'id', 'similarity'
+        )[:limit]
+    )
+
+
+def count_found(recipe_id, expected, found):
+    """How many of ``found`` are as similar as the ``expected`` ones.
+
+    Many recipes tie on the Jaccard index, and which of them the exact
+    top makes room for is decided by id alone: a found recipe counts if
+    it is at least as similar as the least similar expected one.
+    """
+    if not expected:
+        return 0
+    threshold = expected[-1][1]
+    ingredient_sets = similarity.get_ingredient_sets([recipe_id, *found])
+    ingredient_ids = ingredient_sets.pop(recipe_id)
+    return min(len(expected), sum(
+        len(ingredient_ids & ingredients) / len(ingredient_ids | ingredients)
+        >= threshold
+        for ingredients in ingredient_sets.values()
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск похожих рецептов по корзинам MinHash с точным '
+        'подсчётом сходства по всем рецептам с общими ингредиентами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=10)
+        parser.add_argument(
+            '--families', type=int, default=2000,
+            help='Сколько наборов ингредиентов варьируют рецепты.',
+        )
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--samples', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        per_recipe = options['per_recipe']
+        with scratch_database():
+            start = time.perf_counter()
+            authors = seed_users(10)
+            ingredient_ids = seed_ingredients(options['ingredients'])
+            recipe_ids = seed_recipes(
+                authors, options['recipes'], ingredient_ids, per_recipe=0
+            )
+            # Recipes are variations of a few families, so that similar
+            # ones exist: every ingredient of the family is swapped for a
+            # random one with probability 0.2.
+            families = [
+                rng.sample(ingredient_ids, per_recipe)
+                for _ in range(options['families'])
+            ]
+            rows = []
+            for recipe_id in recipe_ids:
+                ingredients = set()
+                for ingredient_id in rng.choice(families):
+                    if rng.random() < 0.2:
+                        ingredient_id = rng.choice(ingredient_ids)
+                    ingredients.add(ingredient_id)
+                rows.extend(
+                    IngredientsInRecipe(
+                        recipe_id=recipe_id, ingredient_id=ingredient_id,
+                        amount=1,
+                    ) for ingredient_id in ingredients
+                )
+            IngredientsInRecipe.objects.bulk_create(rows, batch_size=5000)
+            Recipe.objects.update(ingredients_count=per_recipe)
+            for recipe_id, count in IngredientsInRecipe.objects.values(
+                'recipe_id'
+            ).annotate(count=Count('*')).exclude(
+                count=per_recipe
+            ).values_list('recipe_id', 'count'):
+                Recipe.objects.filter(pk=recipe_id).update(
+                    ingredients_count=count
+                )
+            self.stdout.write(
+                f'Рецептов: {len(recipe_ids)}, строк ингредиентов: '
+                f'{len(rows)} ({time.perf_counter() - start:.1f} с)'
+            )
+            start = time.perf_counter()
+            for offset in range(0, len(recipe_ids), 1000):
+                similarity.update(recipe_ids[offset:offset + 1000])
+            self.stdout.write(
+                f'Корзины построены за {time.perf_counter() - start:.1f} с'
+            )
+            limit = options['limit']
+            found = total = 0
+            lsh_timings = []
+            exact_timings = []
+            for recipe_id in rng.sample(recipe_ids, options['samples']):
+                expected = exact(recipe_id, limit)
+                found += count_found(
+                    recipe_id, expected,
+                    similarity.find_similar(recipe_id, limit),
+                )
+                total += len(expected)
+                lsh_timings.append(measure(
+                    lambda: similarity.find_similar(recipe_id, limit),
+                    options['repeat'],
+                ))
+                exact_timings.append(measure(
+                    lambda: exact(recipe_id, limit), options['repeat']
+                ))
+            self.stdout.write(
+                f'Полнота первых {limit}: {found / max(total, 1):.0%}\n'
+                f'  точный {format_stats(average(exact_timings))}\n'
+                f'  MinHash {format_stats(average(lsh_timings))}'
+            )
+
+
+def average(stats):
+    return {
+        key: sum(item[key] for item in stats) / len(stats)
+        for key in stats[0]
+    }
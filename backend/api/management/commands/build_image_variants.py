@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api import images
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт уменьшенные WebP-копии картинок рецептов и аватаров, '
+        'для которых их ещё нет или которые устарели.'
+    )
+
+    def handle(self, *args, **options):
+        for model, (field_name, _) in images.IMAGE_FIELDS.items():
+            variants_field = images.get_variants_field(field_name)
+            pending = [
+                pk for pk, name, variants in model.objects.exclude(
+                    **{f'{field_name}__isnull': True}
+                ).exclude(**{field_name: ''}).values_list(
+                    'pk', field_name, variants_field
+                )
+                if variants.get('source') != name
+            ]
+            for pk in pending:
+                images.process(model, pk)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {len(pending)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Готово.'))
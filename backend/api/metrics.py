@@ -0,0 +1,146 @@
+"""Per-route request timings as Prometheus histograms.
+
+Each worker adds observations to histograms in its own memory and, at
+most every ``METRICS_FLUSH_INTERVAL`` seconds, adds them to counters in
+the cache with ``incr``, which is atomic in Redis. ``/metrics`` reads
+the counters, so whichever gunicorn worker answers a scrape reports the
+totals of all of them. ``incr`` only takes integers, so durations are
+summed in microseconds. The series seen so far are listed under one
+cache key; a name lost to a concurrent update of that list is merged in
+again on the worker's next flush.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+SERIES_CACHE_KEY = 'metrics:series'
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (1, 2, 5, 10, 20, 50, 100)
+# Name -> (help, bucket bounds, scale of the stored sum).
+HISTOGRAMS = {
+    'foodgram_view_seconds': (
+        'Время работы представления', SECONDS, 10 ** 6
+    ),
+    'foodgram_render_seconds': (
+        'Время сериализации ответа рендерером DRF', SECONDS, 10 ** 6
+    ),
+    'foodgram_db_seconds': (
+        'Время SQL-запросов за запрос', SECONDS, 10 ** 6
+    ),
+    'foodgram_db_queries': (
+        'Число SQL-запросов за запрос', QUERIES, 1
+    ),
+}
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def get_series(name, route, method):
+    if method not in METHODS:
+        method = 'other'
+    return f'{name}|{route}|{method}'
+
+
+def _get_key(series, field):
+    return f'metrics:{series}:{field}'
+
+
+def _get_fields(name):
+    buckets = len(HISTOGRAMS[name][1]) + 1
+    return [*(f'bucket{index}' for index in range(buckets)), 'sum', 'count']
+
+
+class Histograms:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._flushed_at = time.monotonic()
+
+    def observe(self, name, route, method, value):
+        _, bounds, scale = HISTOGRAMS[name]
+        bucket = next(
+            (index for index, bound in enumerate(bounds) if value <= bound),
+            len(bounds),
+        )
+        with self._lock:
+            fields = self._pending[get_series(name, route, method)]
+            fields[f'bucket{bucket}'] += 1
+            fields['sum'] += round(value * scale)
+            fields['count'] += 1
+
+    def maybe_flush(self):
+        if (
+            time.monotonic() - self._flushed_at
+            >= settings.METRICS_FLUSH_INTERVAL
+        ):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = (
+                self._pending, defaultdict(lambda: defaultdict(int))
+            )
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        known = cache.get(SERIES_CACHE_KEY) or set()
+        if not known.issuperset(pending):
+            cache.set(SERIES_CACHE_KEY, known | set(pending), None)
+        for series, fields in pending.items():
+            for field, delta in fields.items():
+                if delta and not cache.add(
+                    _get_key(series, field), delta, None
+                ):
+                    cache.incr(_get_key(series, field), delta)
+
+
+histograms = Histograms()
+
+
+def _format_labels(route, method, le=None):
+    labels = f'view="{route}",method="{method}"'
+    if le is not None:
+        labels += f',le="{le}"'
+    return '{' + labels + '}'
+
+
+def render():
+    """The histograms of all workers in the Prometheus text format."""
+    series = sorted(cache.get(SERIES_CACHE_KEY) or ())
+    keys = [
+        _get_key(item, field)
+        for item in series for field in _get_fields(item.split('|')[0])
+    ]
+    values = cache.get_many(keys)
+    lines = []
+    for name, (help_text, bounds, scale) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for item in series:
+            item_name, route, method = item.split('|')
+            if item_name != name:
+                continue
+            total = 0
+            for index, bound in enumerate([*bounds, '+Inf']):
+                total += values.get(_get_key(item, f'bucket{index}'), 0)
+                labels = _format_labels(route, method, bound)
+                lines.append(f'{name}_bucket{labels} {total}')
+            labels = _format_labels(route, method)
+            value_sum = values.get(_get_key(item, 'sum'), 0) / scale
+            lines.append(f'{name}_sum{labels} {value_sum}')
+            lines.append(
+                f'{name}_count{labels} '
+                f'{values.get(_get_key(item, "count"), 0)}'
+            )
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    histograms.flush()
+    return HttpResponse(
+        render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
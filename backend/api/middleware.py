@@ -0,0 +1,104 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, replicas
+
+
+class QueryTimer:
+    """``execute_wrapper`` that counts the queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class TimingMiddleware:
+    """Time the view, the DRF renderer and the SQL of every request.
+
+    The timings are sent back in a ``Server-Timing`` header and added to
+    the per-route histograms of ``api.metrics``. Placed last in
+    ``MIDDLEWARE``, so that the response is rendered between
+    ``process_template_response`` and the return of ``get_response``.
+    Without ``METRICS_ENABLED`` Django drops it from the stack.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(timer)
+                )
+            response = self.get_response(request)
+        end = time.perf_counter()
+        view_start = getattr(request, '_timing_view_start', start)
+        view_end = getattr(request, '_timing_view_end', end)
+        timings = {
+            'foodgram_view_seconds': view_end - view_start,
+            'foodgram_render_seconds': end - view_end,
+            'foodgram_db_seconds': timer.duration,
+            'foodgram_db_queries': timer.count,
+        }
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timer.duration * 1000:.1f};'
+            f'desc="{timer.count} queries"',
+            f'view;dur={(view_end - view_start) * 1000:.1f}',
+            f'render;dur={(end - view_end) * 1000:.1f}',
+            f'total;dur={(end - start) * 1000:.1f}',
+        ))
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        for name, value in timings.items():
+            metrics.histograms.observe(name, route, request.method, value)
+        metrics.histograms.maybe_flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing_view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request._timing_view_end = time.perf_counter()
+        return response
+
+
+class ReplicaMiddleware:
+    """Let the reads of safe requests go to a replica and keep a client
+    that wrote on the primary for a while, see ``api.replicas``.
+    Without ``DATABASE_REPLICAS`` Django drops it from the stack.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = replicas.start_request(
+            request.method in replicas.SAFE_METHODS
+            and not replicas.is_sticky(request)
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = replicas.finish_request(token)
+        if wrote:
+            replicas.make_sticky(request, response)
+        return response
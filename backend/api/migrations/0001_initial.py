@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-18 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeStamp',
+            fields=[
+                ('scope', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Область')),
+                ('changed_at', models.FloatField(verbose_name='Время изменения')),
+            ],
+            options={
+                'verbose_name': 'Отметка изменения',
+                'verbose_name_plural': 'Отметки изменений',
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import models
+
+
+class ChangeStamp(models.Model):
+    """The "changed at" timestamp of a scope of ``api.conditional``,
+    written to the primary after the cache. A replica holding a stamp
+    has replayed the change that moved it."""
+
+    scope = models.CharField(
+        max_length=64, primary_key=True,
+        verbose_name='Область'
+    )
+    changed_at = models.FloatField(verbose_name='Время изменения')
+
+    class Meta:
+        verbose_name = 'Отметка изменения'
+        verbose_name_plural = 'Отметки изменений'
+
+    def __str__(self):
+        return self.scope
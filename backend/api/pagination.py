@@ -1,6 +1,41 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 
+from recipes import feed
+
+
+def estimate_count(queryset):
+    """Approximate number of rows in ``queryset``.
+
+    PostgreSQL answers with the planner's row estimate; other databases
+    with an exact count that is cached for a short while.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # E.g. a search without matches, filtered by ``pk__in=[]``.
+        return 0
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    key = 'count:' + md5(f'{sql}:{params}'.encode()).hexdigest()
+    return cache.get_or_set(
+        key, queryset.count, settings.PAGINATION_COUNT_CACHE_TIMEOUT
+    )
+
 
 class MainPagination(PageNumberPagination):
     page_size_query_param = 'limit'
@@ -13,3 +48,105 @@ class MainPagination(PageNumberPagination):
             'previous': self.get_previous_link(),
             'results': data
         })
+
+
+class MainCursorPagination(CursorPagination):
+    """Keyset pagination, selected with ``?cursor=``.
+
+    Pages cost the same at any depth; ``count`` is an estimate. Only
+    querysets in ``ordering`` can be paged by a cursor, see ``accepts``.
+    """
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ('-created', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        # Search and the ingredients at hand order their matches by
+        # relevance; that order, rather than ``?ordering=``, is the one
+        # to check.
+        if queryset.query.order_by and all(
+            isinstance(field, str) for field in queryset.query.order_by
+        ):
+            return tuple(queryset.query.order_by)
+        return super().get_ordering(request, queryset, view)
+
+    def accepts(self, request, queryset, view):
+        """Whether a cursor can page ``queryset``.
+
+        The cursor holds a position in the leading field of the ordering
+        only and skips rows that tie with it by an offset. That is exact
+        for ``ordering``, whose fields never change and rarely tie; over
+        counters or a search rank, rows that tie or move between requests
+        would be skipped or repeated.
+        """
+        return self.get_ordering(request, queryset, view) == tuple(
+            self.ordering
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+
+class FeedCursorPagination(MainCursorPagination):
+    """Keyset pagination of the subscription feed.
+
+    The queryset is first narrowed by ``feed.get_feed`` to the recipes
+    of the user's feed that can fall on the requested page; keyset
+    pagination then runs over those few rows.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        # The feed has no ``?ordering=``.
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        offset, reverse, position = self.decode_cursor(request) or (
+            0, False, None
+        )
+        size = offset + self.get_page_size(request) + 1
+        self.count = sum(
+            estimate_count(source) for source in feed.get_sources(request.user)
+        )
+        return super(MainCursorPagination, self).paginate_queryset(
+            feed.get_feed(queryset, request.user, position, reverse, size),
+            request, view,
+        )
+
+
+class UserCursorPagination(MainCursorPagination):
+    ordering = ('id',)
+
+
+class CursorOptInMixin:
+    """Switches a view to ``cursor_pagination_class`` when the request
+    has a ``cursor`` parameter, even an empty one for the first page.
+
+    Orderings the cursor does not accept are paged by number instead.
+    """
+    cursor_pagination_class = MainCursorPagination
+
+    def paginate_queryset(self, queryset):
+        paginator = self.paginator
+        if isinstance(paginator, MainCursorPagination) and not (
+            paginator.accepts(self.request, queryset, self)
+        ):
+            self._paginator = self.pagination_class()
+        return super().paginate_queryset(queryset)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if 'cursor' in self.request.query_params:
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
@@ -0,0 +1,120 @@
+"""Which recipes a user has favourited or put in the cart, and which
+authors they follow, cached per user in the cache framework.
+
+Only the ids that were actually asked about are cached, as an
+id -> bool mapping per user and kind; ids missing from the cache are
+looked up with one query scoped to them. A write bumps the user's
+generation of that kind, so entries written before it are never read
+again.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+FAVORITE = 'favorite'
+SHOPPING_CART = 'shopping_cart'
+FOLLOW = 'follow'
+
+KINDS = {
+    FAVORITE: (Favorite, 'recipe_id'),
+    SHOPPING_CART: (ShoppingCart, 'recipe_id'),
+    FOLLOW: (Follow, 'following_id'),
+}
+
+MAX_ENTRY_SIZE = 10000
+
+
+def _get_generation_key(kind, user_id):
+    return f'relations:{kind}:{user_id}:generation'
+
+
+def invalidate(kind, user_id):
+    """Forget the cached ids of ``kind`` once the transaction commits."""
+    transaction.on_commit(lambda: _new_generation(kind, user_id))
+
+
+def _new_generation(kind, user_id):
+    key = _get_generation_key(kind, user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+class Relations:
+    """Relations of one user, loaded in batches for a serializer."""
+
+    def __init__(self, user):
+        self.user = user
+        self._known = {kind: {} for kind in KINDS}
+
+    def load(self, **ids):
+        """Make ``ids`` (kind -> object ids) known with at most one
+        cache round trip and one query per kind."""
+        if not self.user.is_authenticated:
+            return
+        wanted = {
+            kind: set(kind_ids) - self._known[kind].keys()
+            for kind, kind_ids in ids.items()
+        }
+        wanted = {kind: kind_ids for kind, kind_ids in wanted.items()
+                  if kind_ids}
+        if not wanted:
+            return
+        keys = self._get_keys(wanted)
+        cached = cache.get_many(keys.values())
+        updates = {}
+        for kind, kind_ids in wanted.items():
+            known = cached.get(keys[kind], {})
+            missing = kind_ids - known.keys()
+            if missing:
+                model, field = KINDS[kind]
+                found = set(model.objects.filter(
+                    user=self.user, **{f'{field}__in': missing}
+                ).values_list(field, flat=True))
+                if len(known) + len(missing) > MAX_ENTRY_SIZE:
+                    known = {}
+                known = {**known, **{pk: pk in found for pk in missing}}
+                updates[keys[kind]] = known
+            self._known[kind].update(known)
+        if updates:
+            cache.set_many(updates, settings.RELATIONS_CACHE_TIMEOUT)
+
+    def _get_keys(self, kinds):
+        generation_keys = {
+            kind: _get_generation_key(kind, self.user.pk) for kind in kinds
+        }
+        generations = cache.get_many(generation_keys.values())
+        keys = {}
+        for kind, generation_key in generation_keys.items():
+            generation = generations.get(generation_key)
+            if generation is None:
+                cache.add(generation_key, time.time_ns(), None)
+                generation = cache.get(generation_key)
+            keys[kind] = f'relations:{kind}:{self.user.pk}:{generation}'
+        return keys
+
+    def _has(self, kind, pk):
+        self.load(**{kind: [pk]})
+        return self._known[kind].get(pk, False)
+
+    def is_favorited(self, recipe_id):
+        return self._has(FAVORITE, recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return self._has(SHOPPING_CART, recipe_id)
+
+    def is_subscribed(self, author_id):
+        return self._has(FOLLOW, author_id)
+
+
+def get_relations(context):
+    """The ``Relations`` shared by all serializers of a request."""
+    if 'relations' not in context:
+        context['relations'] = Relations(context['request'].user)
+    return context['relations']
@@ -0,0 +1,150 @@
+"""Reads from read-only replicas of the database.
+
+``ReplicaMiddleware`` lets the reads of a GET, HEAD or OPTIONS request
+go to one of ``settings.DATABASE_REPLICAS``, picked once per request;
+everything else, and all work outside requests, stays on ``default``.
+Once a request writes, the rest of it reads from the primary, and so
+do the client's requests for ``REPLICA_STICKY_TIMEOUT`` seconds after
+it, so that nobody misses their own change because of replication lag.
+Browsers are recognised by a cookie, API clients by a cache marker
+keyed on their ``Authorization`` header. A replica that refuses a
+connection is skipped for ``REPLICA_RETRY_TIMEOUT`` seconds and its
+reads go to the next one, or to the primary.
+
+Views whose validators were not replicated yet read from the primary,
+see ``api.conditional``.
+
+Replicas are ordinary database aliases, so any backend works: locally,
+two SQLite files (the second a copy of the first) will do.
+"""
+import contextvars
+import logging
+import random
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'primary_reads'
+
+_request_state = contextvars.ContextVar('replica_request_state', default=None)
+
+# Alias -> time.monotonic() until which the replica is not tried.
+_unavailable = {}
+
+
+class RequestState:
+    """Where the reads of the current request go."""
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.replica = None
+        self.wrote = False
+
+
+def get_sticky_key(request):
+    credentials = request.META.get('HTTP_AUTHORIZATION')
+    if not credentials:
+        return None
+    return 'replicas:sticky:' + md5(credentials.encode()).hexdigest()
+
+
+def is_sticky(request):
+    """Whether the client wrote recently enough to read its writes only
+    from the primary."""
+    if STICKY_COOKIE in request.COOKIES:
+        return True
+    key = get_sticky_key(request)
+    return key is not None and bool(cache.get(key))
+
+
+def make_sticky(request, response):
+    timeout = settings.REPLICA_STICKY_TIMEOUT
+    response.set_cookie(
+        STICKY_COOKIE, '1', max_age=timeout, httponly=True, samesite='Lax'
+    )
+    key = get_sticky_key(request)
+    if key is not None:
+        cache.set(key, True, timeout)
+
+
+def start_request(use_replica):
+    return _request_state.set(RequestState(use_replica))
+
+
+def finish_request(token):
+    """Forget the request's state; return whether it wrote."""
+    state = _request_state.get()
+    _request_state.reset(token)
+    return state.wrote
+
+
+def get_replica():
+    """The replica the current request reads from, None when its reads
+    go to the primary."""
+    state = _request_state.get()
+    # Reads inside a transaction see its writes.
+    if (
+        state is None
+        or not state.use_replica
+        or state.wrote
+        or connections[DEFAULT_DB_ALIAS].in_atomic_block
+    ):
+        return None
+    if state.replica is None:
+        state.replica = _choose_replica()
+    if state.replica == DEFAULT_DB_ALIAS:
+        return None
+    return state.replica
+
+
+def use_primary():
+    """Send the remaining reads of the current request to the primary."""
+    state = _request_state.get()
+    if state is not None:
+        state.use_replica = False
+
+
+def _choose_replica():
+    now = time.monotonic()
+    aliases = [
+        alias for alias in settings.DATABASE_REPLICAS
+        if _unavailable.get(alias, 0) <= now
+    ]
+    random.shuffle(aliases)
+    for alias in aliases:
+        try:
+            connections[alias].ensure_connection()
+        except OperationalError:
+            logger.warning('Replica %s is unavailable', alias, exc_info=True)
+            _unavailable[alias] = now + settings.REPLICA_RETRY_TIMEOUT
+            continue
+        return alias
+    return DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    """Sends the reads of safe requests to a replica, see the module
+    docstring. Writes always go to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if _request_state.get() is None:
+            return None
+        # Named explicitly: with no answer Django would read related
+        # objects from the database their instance came from.
+        return get_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary.
+        return True
@@ -0,0 +1,149 @@
+"""Recipe list representations built straight from ``values()`` rows.
+
+Producing a page with ``RecipeSerializer`` spends most of its time in
+DRF's field machinery: model instances for every recipe, author and
+ingredient row, a ``UserSerializer`` per recipe and a method call per
+``SerializerMethodField``. The functions here build the same dicts,
+key for key and value for value, from plain rows fetched with one query
+per kind, so the list views can skip the serializers entirely. Any
+field added to ``RecipeSerializer``, ``RecipeShortSerializer`` or
+``UserSerializer`` has to be added here too.
+"""
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from recipes.models import IngredientsInRecipe
+from users.models import User
+
+from . import images
+from .relations import get_relations
+
+# ``created`` is not shown but positions the cursor pagination.
+RECIPE_FIELDS = (
+    'id', 'author_id', 'name', 'image', 'image_variants', 'text',
+    'cooking_time', 'favorites_count', 'in_carts_count', 'created',
+)
+SHORT_RECIPE_FIELDS = (
+    'id', 'name', 'image', 'image_variants', 'cooking_time',
+)
+USER_FIELDS = (
+    'id', 'email', 'username', 'first_name', 'last_name',
+    'avatar', 'avatar_variants',
+)
+
+
+class _URLBuilder:
+    """URLs of stored files, absolute when there is a request, as the
+    serializers' image fields make them."""
+
+    def __init__(self, context):
+        request = context.get('request')
+        self.build = request.build_absolute_uri if request else str
+
+    def image(self, name):
+        if not name:
+            return None
+        return self.build(default_storage.url(name))
+
+    def variants(self, name, variants):
+        if not name:
+            return None
+        names = images.get_variant_names(name, variants)
+        return {
+            size: self.build(default_storage.url(names.get(size, name)))
+            for size in settings.IMAGE_VARIANTS
+        }
+
+
+def get_ingredients(recipe_ids):
+    """Recipe id -> ingredients as ``IngredientsInRecipeSerializer``
+    shows them."""
+    ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+    for recipe_id, *row in IngredientsInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('id').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount',
+    ):
+        ingredients[recipe_id].append(dict(zip(
+            ('id', 'name', 'measurement_unit', 'amount'), row
+        )))
+    return ingredients
+
+
+def get_users(user_ids, context, urls=None):
+    """User id -> user as ``UserSerializer`` shows them."""
+    urls = urls or _URLBuilder(context)
+    has_request = 'request' in context
+    if has_request:
+        relations = get_relations(context)
+        relations.load(follow=user_ids)
+    users = {}
+    for row in User.objects.filter(pk__in=user_ids).values(*USER_FIELDS):
+        users[row['id']] = {
+            'email': row['email'],
+            'id': row['id'],
+            'username': row['username'],
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'is_subscribed': (
+                has_request and relations.is_subscribed(row['id'])
+            ),
+            'avatar': urls.image(row['avatar']),
+            'avatar_variants': urls.variants(
+                row['avatar'], row['avatar_variants']
+            ),
+        }
+    return users
+
+
+def get_recipes(rows, context):
+    """``RecipeSerializer(many=True)`` data of recipes fetched as
+    ``values(*RECIPE_FIELDS)``."""
+    rows = list(rows)
+    recipe_ids = [row['id'] for row in rows]
+    author_ids = list({row['author_id'] for row in rows})
+    relations = get_relations(context)
+    relations.load(
+        favorite=recipe_ids, shopping_cart=recipe_ids, follow=author_ids
+    )
+    urls = _URLBuilder(context)
+    authors = get_users(author_ids, context, urls)
+    ingredients = get_ingredients(recipe_ids)
+    return [
+        {
+            'id': row['id'],
+            'author': authors[row['author_id']],
+            'name': row['name'],
+            'image': urls.image(row['image']),
+            'image_variants': urls.variants(
+                row['image'], row['image_variants']
+            ),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+            'ingredients': ingredients[row['id']],
+            'is_favorited': relations.is_favorited(row['id']),
+            'is_in_shopping_cart': relations.is_in_shopping_cart(row['id']),
+            'favorites_count': row['favorites_count'],
+            'in_carts_count': row['in_carts_count'],
+        }
+        for row in rows
+    ]
+
+
+def get_short_recipes(rows, context):
+    """``RecipeShortSerializer(many=True)`` data of recipes fetched as
+    ``values(*SHORT_RECIPE_FIELDS)``."""
+    urls = _URLBuilder(context)
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'image': urls.image(row['image']),
+            'image_variants': urls.variants(
+                row['image'], row['image_variants']
+            ),
+            'cooking_time': row['cooking_time'],
+        }
+        for row in rows
+    ]
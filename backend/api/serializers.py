@@ -1,6 +1,17 @@
+import json
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import QueryDict
 from rest_framework import serializers
-from drf_extra_fields.fields import Base64ImageField
 
+from recipes import shopping_list, similarity
+from recipes.catalog import get_ingredients
+from . import images
+from .uploads import UploadedImageField
+from .relations import get_relations
 from recipes.models import (
     Ingredient,
     Recipe,
@@ -8,7 +19,31 @@ from recipes.models import (
     Favorite,
     ShoppingCart
 )
-from users.models import User, Follow
+from users.models import User
+
+
+class ImageVariantsField(serializers.Field):
+    """URLs of the WebP variants of an image, by size. The original
+    stands in for the sizes that are not ready yet."""
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, instance):
+        image = getattr(instance, self.image_field)
+        if not image:
+            return None
+        names = images.get_variant_names(
+            image.name,
+            getattr(instance, images.get_variants_field(self.image_field)),
+        )
+        request = self.context.get('request')
+        urls = {}
+        for size in settings.IMAGE_VARIANTS:
+            url = default_storage.url(names.get(size, image.name))
+            urls[size] = request.build_absolute_uri(url) if request else url
+        return urls
 
 
 class IngredientsInRecipeSerializer(serializers.ModelSerializer):
@@ -37,6 +72,19 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('__all__')
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Loads the user's relations to the whole page at once."""
+
+    def to_representation(self, data):
+        recipes = list(data)
+        get_relations(self.context).load(
+            favorite=[recipe.id for recipe in recipes],
+            shopping_cart=[recipe.id for recipe in recipes],
+            follow=[recipe.author_id for recipe in recipes],
+        )
+        return super().to_representation(recipes)
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     author = serializers.SerializerMethodField(
         read_only=True,
@@ -48,6 +96,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         fields = (
@@ -55,29 +104,64 @@ class RecipeSerializer(serializers.ModelSerializer):
             'author',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
+            'favorites_count',
+            'in_carts_count',
         )
         model = Recipe
+        list_serializer_class = RecipeListSerializer
 
     def get_author(self, obj):
         return UserSerializer(obj.author, context=self.context).data
 
     def get_is_favorited(self, obj):
-        return obj.id in self.context.get('favorited_ids', set())
+        return get_relations(self.context).is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if not user.is_authenticated:
-            return False
-        return ShoppingCart.objects.filter(user=user, recipe=obj).exists()
+        return get_relations(self.context).is_in_shopping_cart(obj.id)
+
+
+class IngredientIdField(serializers.PrimaryKeyRelatedField):
+    """Takes the ingredient from ``resolved`` when the list serializer
+    has looked up the ids of the whole list."""
+    resolved = None
+
+    def to_internal_value(self, data):
+        if self.resolved is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.resolved[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class IngredientsInRecipeListSerializer(serializers.ListSerializer):
+    """Resolves the ingredient ids of all items at once instead of one
+    query per item."""
+
+    def to_internal_value(self, data):
+        ids = set()
+        if isinstance(data, list):
+            for item in data:
+                try:
+                    ids.add(int(item['id']))
+                except (KeyError, TypeError, ValueError):
+                    pass
+        self.child.fields['id'].resolved = get_ingredients(ids)
+        return super().to_internal_value(data)
 
 
 class IngredientsInRecipeCreateSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
+    id = IngredientIdField(
         queryset=Ingredient.objects.all(),
         source='ingredient',
     )
@@ -87,13 +171,14 @@ class IngredientsInRecipeCreateSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'amount',
         )
+        list_serializer_class = IngredientsInRecipeListSerializer
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = IngredientsInRecipeCreateSerializer(
         many=True
     )
-    image = Base64ImageField(required=True)
+    image = UploadedImageField(required=True)
 
     class Meta:
         model = Recipe
@@ -105,23 +190,37 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'ingredients',
         )
 
+    def to_internal_value(self, data):
+        # A multipart form can't nest objects, so it sends the
+        # ingredients as a JSON string.
+        if isinstance(data, QueryDict):
+            data = data.dict()
+            try:
+                data['ingredients'] = json.loads(data['ingredients'])
+            except (KeyError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe.objects.create(
+            **validated_data, ingredients_count=len(ingredients_data)
+        )
         self.create_ingredients(recipe, ingredients_data)
+        similarity.update([recipe.id])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients', None)
+        if ingredients_data is None:
+            raise serializers.ValidationError()
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
+        instance.ingredients_count = len(ingredients_data)
         instance.save()
-        if ingredients_data is not None:
-            instance.recipeinlist.all().delete()
-            self.create_ingredients(instance, ingredients_data)
-            return instance
-        else:
-            raise serializers.ValidationError()
+        self.update_ingredients(instance, ingredients_data)
+        return instance
 
     def validate_ingredients(self, ingredients):
         if not ingredients:
@@ -131,6 +230,41 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError()
         return ingredients
 
+    def update_ingredients(self, recipe, ingredients):
+        """Insert, update and delete only the rows that differ from the
+        recipe's current ingredients."""
+        rows = {row.ingredient_id: row for row in recipe.recipeinlist.all()}
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in rows.items()
+        }
+        new_amounts = {
+            item['ingredient'].id: item['amount'] for item in ingredients
+        }
+        if new_amounts == old_amounts:
+            return
+        removed = [
+            row.pk for ingredient_id, row in rows.items()
+            if ingredient_id not in new_amounts
+        ]
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            row = rows.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        added = [
+            item for item in ingredients if item['ingredient'].id not in rows
+        ]
+        if removed:
+            IngredientsInRecipe.objects.filter(pk__in=removed).delete()
+        if changed:
+            IngredientsInRecipe.objects.bulk_update(changed, ['amount'])
+        if added:
+            self.create_ingredients(recipe, added)
+        if removed or added:
+            similarity.update([recipe.id])
+        shopping_list.change_recipe(recipe.id, old_amounts, new_amounts)
+
     def create_ingredients(self, recipe, ingredients):
         IngredientsInRecipe.objects.bulk_create([
             IngredientsInRecipe(
@@ -148,6 +282,13 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return image
 
     def to_representation(self, instance):
+        # One query for the ingredients instead of one per row.
+        prefetch_related_objects([instance], Prefetch(
+            'recipeinlist',
+            queryset=IngredientsInRecipe.objects.select_related(
+                'ingredient'
+            ).order_by('id'),
+        ))
         return RecipeSerializer(instance, context=self.context).data
 
 
@@ -158,19 +299,38 @@ class FavoriteSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class RecipeBatchSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RELATIONS_BATCH_MAX_SIZE,
+    )
+
+
 class RecipeShortSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'name',
-            'image', 'cooking_time',
+            'image', 'image_variants', 'cooking_time',
         )
 
 
+class UserListSerializer(serializers.ListSerializer):
+    """Loads the user's follows of the whole page at once."""
+
+    def to_representation(self, data):
+        users = list(data)
+        get_relations(self.context).load(follow=[user.id for user in users])
+        return super().to_representation(users)
+
+
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.ImageField(read_only=True)
+    avatar_variants = ImageVariantsField('avatar')
 
     class Meta:
         model = User
@@ -182,13 +342,16 @@ class UserSerializer(serializers.ModelSerializer):
             'last_name',
             'is_subscribed',
             'avatar',
+            'avatar_variants',
         )
+        list_serializer_class = UserListSerializer
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if not request or not request.user.is_authenticated:
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        if 'request' not in self.context:
             return False
-        return Follow.objects.filter(user=request.user, following=obj).exists()
+        return get_relations(self.context).is_subscribed(obj.id)
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -221,8 +384,16 @@ class PasswordSerializer(serializers.Serializer):
     new_password = serializers.CharField(write_only=True)
 
 
+class RecipeImageSerializer(serializers.ModelSerializer):
+    image = UploadedImageField()
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+
 class AvatarSerializer(serializers.ModelSerializer):
-    avatar = Base64ImageField()
+    avatar = UploadedImageField()
 
     class Meta:
         model = User
@@ -233,6 +404,7 @@ class FollowSerializer(serializers.ModelSerializer):
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
+    avatar_variants = ImageVariantsField('avatar')
 
     class Meta:
         model = User
@@ -240,20 +412,22 @@ class FollowSerializer(serializers.ModelSerializer):
             'email', 'id', 'username',
             'first_name', 'last_name',
             'is_subscribed', 'recipes',
-            'recipes_count', 'avatar',
+            'recipes_count', 'avatar', 'avatar_variants',
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        return user.is_authenticated and \
-            obj.follower.filter(user=user).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return get_relations(self.context).is_subscribed(obj.id)
 
     def get_recipes(self, obj):
-        limit = self.context.get('recipes_limit')
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            limit = self.context.get('recipes_limit')
 
-        recipes = Recipe.objects.filter(author=obj)
-        if limit is not None and limit.isdigit():
-            recipes = recipes[:int(limit)]
+            recipes = Recipe.objects.filter(author=obj)
+            if limit is not None and limit.isdigit():
+                recipes = recipes[:int(limit)]
 
         return RecipeShortSerializer(
             recipes,
@@ -262,6 +436,8 @@ class FollowSerializer(serializers.ModelSerializer):
         ).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -0,0 +1,74 @@
+"""Compact base62 short links to recipes.
+
+A short link ``/r/<code>/`` carries the recipe id written in base62;
+links shared earlier, ``/s/<id>/``, carry the id itself. Resolving
+either is a redirect to the recipe page of the frontend; it bypasses
+DRF entirely, and which recipes exist is cached until they are deleted.
+Clients may keep the redirect for a few minutes only, so the link of a
+deleted recipe soon stops resolving for them too.
+"""
+from string import ascii_letters, digits
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponseRedirect
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_safe
+
+from recipes.models import Recipe
+
+ALPHABET = digits + ascii_letters
+BASE = len(ALPHABET)
+INDEX = {char: value for value, char in enumerate(ALPHABET)}
+# The largest primary key a database column can hold.
+MAX_ID = 2 ** 63 - 1
+
+
+def encode(number):
+    code = ''
+    while True:
+        number, remainder = divmod(number, BASE)
+        code = ALPHABET[remainder] + code
+        if not number:
+            return code
+
+
+def decode(code):
+    number = 0
+    for char in code:
+        number = number * BASE + INDEX[char]
+    return number
+
+
+def get_cache_key(recipe_id):
+    return f'short-link:{recipe_id}'
+
+
+def forget(recipe_id):
+    cache.delete(get_cache_key(recipe_id))
+
+
+@require_safe
+def resolve(request, code):
+    return redirect(decode(code))
+
+
+@require_safe
+def resolve_id(request, pk):
+    """Links shared before the codes existed carry the plain id."""
+    return redirect(int(pk))
+
+
+def redirect(recipe_id):
+    cache_key = get_cache_key(recipe_id)
+    if cache.get(cache_key) is None:
+        if recipe_id > MAX_ID or not Recipe.objects.filter(
+            pk=recipe_id
+        ).exists():
+            raise Http404('Рецепт не найден.')
+        cache.set(cache_key, recipe_id, settings.SHORT_LINK_CACHE_TIMEOUT)
+    response = HttpResponseRedirect(f'/recipes/{recipe_id}')
+    patch_cache_control(
+        response, public=True, max_age=settings.SHORT_LINK_MAX_AGE
+    )
+    return response
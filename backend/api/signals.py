@@ -0,0 +1,81 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from recipes.signals import is_changing_in_bulk, relations_bulk_changed
+from users.models import Follow, User
+
+from . import conditional, images, relations, shortlinks
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, **kwargs):
+    conditional.touch(conditional.RECIPES)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(shortlinks.forget, instance.pk))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    conditional.touch(conditional.INGREDIENTS)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def author_changed(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    conditional.touch(conditional.AUTHORS)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_saved(sender, instance, **kwargs):
+    images.schedule(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def image_deleted(sender, instance, **kwargs):
+    field_name, _ = images.IMAGE_FIELDS[sender]
+    variants = getattr(instance, images.get_variants_field(field_name))
+    transaction.on_commit(partial(images.delete_files, variants))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def relation_changed(sender, instance, **kwargs):
+    if is_changing_in_bulk():
+        return
+    invalidate_relations(sender, instance.user_id)
+
+
+@receiver(relations_bulk_changed, sender=Favorite)
+@receiver(relations_bulk_changed, sender=ShoppingCart)
+def relations_changed_in_bulk(sender, user_id, **kwargs):
+    invalidate_relations(sender, user_id)
+
+
+def invalidate_relations(model, user_id):
+    conditional.touch(conditional.get_user_scope(user_id))
+    if model is not Follow:
+        # Recipe pages show how many users favourited or carted them.
+        conditional.touch(conditional.COUNTERS)
+    kind = {
+        Favorite: relations.FAVORITE,
+        ShoppingCart: relations.SHOPPING_CART,
+        Follow: relations.FOLLOW,
+    }[model]
+    relations.invalidate(kind, user_id)
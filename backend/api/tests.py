@@ -0,0 +1,1390 @@
+import base64
+import random
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Prefetch
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from PIL import ExifTags, Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientsInRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    StoredFile,
+    TimelineEntry,
+    UserRecipeQuerySet,
+)
+from recipes import counters, similarity
+from recipes.storage import ContentAddressedStorage
+from users.models import Follow, User
+
+from . import metrics, replicas, representations, shortlinks
+from .models import ChangeStamp
+from .renderers import FastJSONRenderer
+from .serializers import (
+    IngredientsInRecipeCreateSerializer,
+    RecipeSerializer,
+    RecipeShortSerializer,
+)
+from .uploads import ImageUploadHandler
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='foodgram-tests-')
+WRITE = re.compile(r'(INSERT INTO|UPDATE|DELETE FROM) "\w+"')
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def create_user(username):
+    return User.objects.create_user(
+        email=f'{username}@example.com',
+        username=username,
+        first_name='Имя',
+        last_name='Фамилия',
+        password='Secret-password-1',
+    )
+
+
+def make_image(color):
+    buffer = BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def make_photo(width, height, orientation=1):
+    """A JPEG such as a phone takes: turned by EXIF, with GPS tags."""
+    exif = Image.Exif()
+    exif[ExifTags.Base.Orientation] = orientation
+    exif[ExifTags.Base.Make] = 'Camera'
+    gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    gps[ExifTags.GPS.GPSLatitude] = (55.0, 45.0, 21.0)
+    gps[ExifTags.GPS.GPSLongitude] = (37.0, 37.0, 4.0)
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'red').save(buffer, 'JPEG', exif=exif)
+    return buffer.getvalue()
+
+
+def create_recipes(authors, count, ingredients, per_recipe=3):
+    recipes = Recipe.objects.bulk_create(
+        Recipe(
+            author=authors[number % len(authors)],
+            name=f'Рецепт {number}',
+            text='Описание',
+            image='recipes/test.png',
+            cooking_time=number % 60 + 1,
+            ingredients_count=per_recipe,
+        ) for number in range(count)
+    )
+    IngredientsInRecipe.objects.bulk_create(
+        IngredientsInRecipe(
+            recipe=recipe,
+            ingredient=ingredients[(recipe.pk + offset) % len(ingredients)],
+            amount=offset + 1,
+        )
+        for recipe in recipes
+        for offset in range(per_recipe)
+    )
+    return recipes
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class APITestCase(TestCase):
+
+    def setUp(self):
+        # Relations, validators and short links are cached.
+        cache.clear()
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+
+class QueryBudgetTests(APITestCase):
+    """Pages cost the same number of queries whatever their size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(20)
+        )
+        cls.recipes = create_recipes(
+            [cls.author, cls.reader], 120, ingredients
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.reader, recipe=recipe)
+            for recipe in cls.recipes[::3]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.reader, recipe=recipe)
+            for recipe in cls.recipes[::4]
+        )
+        Follow.objects.create(user=cls.reader, following=cls.author)
+
+    def assert_queries(self, count, client, url):
+        with self.assertNumQueries(count):
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_anonymous(self):
+        # Count, page, authors, ingredients.
+        for limit in (6, 100):
+            with self.subTest(limit=limit):
+                response = self.assert_queries(
+                    4, self.client_for(), f'/api/recipes/?limit={limit}'
+                )
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_list_authenticated(self):
+        # Token, count, page, favourites, cart, follows, authors,
+        # ingredients.
+        for limit in (6, 100):
+            with self.subTest(limit=limit):
+                cache.clear()
+                response = self.assert_queries(
+                    8,
+                    self.client_for(self.reader),
+                    f'/api/recipes/?limit={limit}',
+                )
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_list_authenticated_cached_relations(self):
+        client = self.client_for(self.reader)
+        client.get('/api/recipes/?limit=100')
+        self.assert_queries(5, client, '/api/recipes/?limit=100')
+
+    def test_detail_anonymous(self):
+        # Validators, recipe with author, ingredients.
+        self.assert_queries(
+            3, self.client_for(), f'/api/recipes/{self.recipes[0].pk}/'
+        )
+
+    def test_detail_authenticated(self):
+        # Token, validators, recipe with author, ingredients, favourite,
+        # cart, follow.
+        self.assert_queries(
+            7,
+            self.client_for(self.reader),
+            f'/api/recipes/{self.recipes[0].pk}/',
+        )
+
+    def test_short_link(self):
+        recipe = self.recipes[15]
+        client = self.client_for()
+        for url in (
+            f'/s/{recipe.pk}/',
+            f'/r/{shortlinks.encode(recipe.pk)}/',
+        ):
+            with self.subTest(url=url):
+                cache.clear()
+                with self.assertNumQueries(1):
+                    response = client.get(url)
+                self.assertRedirects(
+                    response,
+                    f'/recipes/{recipe.pk}',
+                    fetch_redirect_response=False,
+                )
+                self.assertEqual(
+                    response['Cache-Control'],
+                    f'public, max-age={settings.SHORT_LINK_MAX_AGE}',
+                )
+                with self.assertNumQueries(0):
+                    client.get(url)
+
+
+class CursorOrderingTests(APITestCase):
+    """A cursor pages the newest-first order only; ranked and counter
+    orderings asked for with a cursor are paged by number."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(4)
+        )
+        # The most relevant recipes are the oldest.
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=cls.author,
+                name=name,
+                text=text,
+                image='recipes/test.png',
+                cooking_time=10,
+            )
+            for name, text in (
+                ('Суп суп суп', 'Описание'),
+                ('Суп суп', 'Описание'),
+                ('Суп', 'Суп'),
+                ('Суп', 'Описание'),
+                ('Суп', 'Описание'),
+                ('Каша', 'Не суп'),
+                ('Каша', 'Описание'),
+            )
+        )
+        ingredients = cls.ingredients
+        uses = {
+            cls.recipes[0]: ingredients,
+            cls.recipes[1]: ingredients[:1],
+            cls.recipes[2]: ingredients[:2],
+            cls.recipes[3]: [ingredients[0], ingredients[3]],
+            cls.recipes[4]: ingredients[2:],
+        }
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe, used in uses.items()
+            for ingredient in used
+        )
+        for recipe, used in uses.items():
+            recipe.ingredients_count = len(used)
+        Recipe.objects.bulk_update(uses, ['ingredients_count'])
+
+    def get_ids(self, url, paged_by='page', **params):
+        client = self.client_for()
+        ids = []
+        while url:
+            response = client.get(url, params)
+            params = None
+            self.assertEqual(response.status_code, 200)
+            ids.extend(recipe['id'] for recipe in response.json()['results'])
+            url = response.json()['next']
+            if url:
+                self.assertIn(f'{paged_by}=', url)
+        return ids
+
+    def test_newest_first(self):
+        newest = [recipe.pk for recipe in reversed(self.recipes)]
+        self.assertEqual(
+            self.get_ids('/api/recipes/', 'cursor', limit=2, cursor=''),
+            newest,
+        )
+        self.assertEqual(
+            self.get_ids(
+                '/api/recipes/', 'cursor',
+                limit=2, cursor='', ordering='-created',
+            ),
+            newest,
+        )
+
+    def test_tied_counters(self):
+        recipes = self.recipes
+        Recipe.objects.update(favorites_count=1)
+        Recipe.objects.filter(
+            pk__in=[recipes[1].pk, recipes[4].pk]
+        ).update(favorites_count=2)
+        expected = [recipes[4].pk, recipes[1].pk] + [
+            recipe.pk for recipe in reversed(recipes)
+            if recipe not in (recipes[1], recipes[4])
+        ]
+        for limit in (1, 2, 3):
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    self.get_ids(
+                        '/api/recipes/', limit=limit, cursor='',
+                        ordering='-favorites_count',
+                    ),
+                    expected,
+                )
+
+    def test_search(self):
+        ranked = self.get_ids('/api/recipes/', search='суп', limit=100)
+        self.assertEqual(
+            ranked,
+            [recipe.pk for recipe in self.recipes[:3]]
+            + [self.recipes[4].pk, self.recipes[3].pk, self.recipes[5].pk],
+        )
+        self.assertEqual(
+            self.get_ids('/api/recipes/', search='суп', limit=2, cursor=''),
+            ranked,
+        )
+        self.assertEqual(
+            self.get_ids('/api/recipes/', search='борщ', cursor=''), []
+        )
+
+    def test_ingredients(self):
+        first, second = self.ingredients[:2]
+        params = {'ingredients': f'{first.pk},{second.pk}', 'missing': 2}
+        ranked = self.get_ids('/api/recipes/', limit=100, **params)
+        self.assertEqual(
+            ranked,
+            [self.recipes[number].pk for number in (2, 1, 3, 0)],
+        )
+        self.assertEqual(
+            self.get_ids('/api/recipes/', limit=1, cursor='', **params),
+            ranked,
+        )
+
+
+class BatchTests(APITestCase):
+    """Batch endpoints count only the rows they insert or delete."""
+
+    url = '/api/recipes/shopping_cart/batch/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        cls.recipes = create_recipes([cls.author], 3, ingredients, 2)
+
+    def get_list(self, user):
+        return dict(ShoppingListItem.objects.filter(user=user).values_list(
+            'ingredient_id', 'amount'
+        ))
+
+    def get_counts(self):
+        return dict(Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in self.recipes]
+        ).values_list('id', 'in_carts_count'))
+
+    def test_add_race(self):
+        first, second = self.recipes[:2]
+        add_missing = UserRecipeQuerySet.add_missing
+
+        def add_after_concurrent_request(queryset, user, recipe_ids):
+            # Another request adds the first recipe after the check.
+            ShoppingCart.objects.create(user=user, recipe=first)
+            return add_missing(queryset, user, recipe_ids)
+
+        with mock.patch.object(
+            UserRecipeQuerySet, 'add_missing', add_after_concurrent_request,
+        ):
+            response = self.client_for(self.reader).post(
+                self.url, {'recipes': [first.pk, second.pk]}, format='json'
+            )
+        self.assertEqual(response.json(), [
+            {'id': first.pk, 'status': 'exists'},
+            {'id': second.pk, 'status': 'added'},
+        ])
+        self.assertEqual(
+            self.get_counts(),
+            {first.pk: 1, second.pk: 1, self.recipes[2].pk: 0},
+        )
+        expected = {}
+        for recipe in (first, second):
+            for row in recipe.recipeinlist.all():
+                expected[row.ingredient_id] = (
+                    expected.get(row.ingredient_id, 0) + row.amount
+                )
+        self.assertEqual(self.get_list(self.reader), expected)
+
+    def test_remove(self):
+        for user in (self.author, self.reader):
+            for recipe in self.recipes[:2]:
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+        author_list = self.get_list(self.author)
+        response = self.client_for(self.reader).delete(
+            self.url,
+            {'recipes': [recipe.pk for recipe in self.recipes]},
+            format='json',
+        )
+        self.assertEqual(
+            [row['status'] for row in response.json()],
+            ['removed', 'removed', 'missing'],
+        )
+        self.assertEqual(
+            self.get_counts(),
+            {self.recipes[0].pk: 1, self.recipes[1].pk: 1,
+             self.recipes[2].pk: 0},
+        )
+        self.assertEqual(self.get_list(self.reader), {})
+        self.assertEqual(self.get_list(self.author), author_list)
+        self.assertFalse(ShoppingCart.objects.filter(user=self.reader))
+
+
+class RecipeUpdateTests(APITestCase):
+    """Editing a recipe writes only what changed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(6)
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.author)
+        self.data = {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': make_image('red'),
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in self.ingredients[:4]
+            ],
+        }
+        response = self.client.post('/api/recipes/', self.data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.recipe = Recipe.objects.get(pk=response.json()['id'])
+
+    def get_writes(self, **changes):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.pk}/',
+                {**self.data, **changes},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        # Statement and table, e.g. 'UPDATE "recipes_recipe"'.
+        return [
+            match[0] for match in (
+                WRITE.match(query['sql']) for query in queries
+            ) if match
+        ]
+
+    def test_unknown_ingredient_errors(self):
+        # Same errors, item by item, as a PrimaryKeyRelatedField's.
+        messages = IngredientsInRecipeCreateSerializer().fields[
+            'id'
+        ].error_messages
+        ingredients = [
+            {'id': self.ingredients[0].pk, 'amount': 1},
+            {'id': 10 ** 6, 'amount': 1},
+            {'id': 'соль', 'amount': 1},
+            {'id': True, 'amount': 1},
+            {'id': 10 ** 6 + 1, 'amount': 1},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.pk}/',
+                {**self.data, 'ingredients': ingredients},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'ingredients': [
+            {},
+            {'id': [messages['does_not_exist'].format(pk_value=10 ** 6)]},
+            {'id': [messages['incorrect_type'].format(data_type='str')]},
+            {'id': [messages['incorrect_type'].format(data_type='bool')]},
+            {'id': [
+                messages['does_not_exist'].format(pk_value=10 ** 6 + 1)
+            ]},
+        ]})
+        # One lookup for the whole list, none once the catalog is built.
+        self.assertLessEqual(
+            sum('FROM "recipes_ingredient"' in query['sql']
+                for query in queries),
+            1
+        )
+
+    def get_amounts(self):
+        return dict(IngredientsInRecipe.objects.filter(
+            recipe=self.recipe
+        ).values_list('ingredient_id', 'amount'))
+
+    def test_text_only(self):
+        name = self.recipe.image.name
+        references = StoredFile.objects.get(name=name).references
+        with mock.patch.object(ContentAddressedStorage, 'save') as save:
+            writes = self.get_writes(text='Исправленное описание')
+        self.assertEqual(writes, ['UPDATE "recipes_recipe"'])
+        save.assert_not_called()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, name)
+        self.assertEqual(self.recipe.text, 'Исправленное описание')
+        self.assertEqual(
+            StoredFile.objects.get(name=name).references, references
+        )
+
+    def test_amount_changed(self):
+        ingredients = [dict(item) for item in self.data['ingredients']]
+        ingredients[0]['amount'] = 50
+        ingredients[1]['amount'] = 60
+        writes = self.get_writes(ingredients=ingredients)
+        self.assertEqual(
+            [write for write in writes if 'ingredientsinrecipe' in write],
+            ['UPDATE "recipes_ingredientsinrecipe"'],
+        )
+        self.assertEqual(
+            self.get_amounts(),
+            {item['id']: item['amount'] for item in ingredients},
+        )
+
+    def test_ingredients_added_and_removed(self):
+        rows = dict(IngredientsInRecipe.objects.filter(
+            recipe=self.recipe
+        ).values_list('ingredient_id', 'pk'))
+        ingredients = self.data['ingredients'][1:] + [
+            {'id': ingredient.pk, 'amount': 5}
+            for ingredient in self.ingredients[4:]
+        ]
+        writes = [
+            write for write in self.get_writes(ingredients=ingredients)
+            if 'ingredientsinrecipe' in write
+        ]
+        self.assertEqual(sorted(writes), [
+            'DELETE FROM "recipes_ingredientsinrecipe"',
+            'INSERT INTO "recipes_ingredientsinrecipe"',
+        ])
+        self.assertEqual(
+            self.get_amounts(),
+            {item['id']: item['amount'] for item in ingredients},
+        )
+        # The kept rows are not rewritten.
+        for item in self.data['ingredients'][1:]:
+            self.assertTrue(IngredientsInRecipe.objects.filter(
+                pk=rows[item['id']], amount=item['amount']
+            ).exists())
+
+
+class RepresentationTests(APITestCase):
+    """The rows-based representations render to the same bytes as the
+    serializers, whatever the data."""
+
+    # Non-ASCII, characters JSON escapes and the line separators DRF
+    # escapes on top.
+    ALPHABET = 'abcXYZ ёжЯ"\\/\n\t<>&\x01\u2028\u2029😀'
+
+    def get_text(self, rng, length=12):
+        return ''.join(
+            rng.choice(self.ALPHABET) for _ in range(rng.randint(1, length))
+        )
+
+    def get_variants(self, rng, name):
+        if rng.random() < 0.5:
+            return {}
+        variants = {
+            size: f'{name}_{size}.webp' for size in settings.IMAGE_VARIANTS
+        }
+        return {'source': name, **variants}
+
+    def create_data(self, rng, trial):
+        users = []
+        for number in range(4):
+            user = create_user(f'user-{trial}-{number}')
+            user.first_name = self.get_text(rng)
+            user.last_name = self.get_text(rng)
+            if rng.random() < 0.5:
+                user.avatar = 'users/avatar.png'
+                user.avatar_variants = self.get_variants(rng, 'users/avatar')
+            user.save()
+            users.append(user)
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'{self.get_text(rng)} {trial}-{number}',
+                measurement_unit=self.get_text(rng, 3),
+            )
+            for number in range(6)
+        )
+        for _ in range(rng.randint(1, 8)):
+            image = 'recipes/image.png' if rng.random() < 0.8 else ''
+            recipe = Recipe.objects.create(
+                author=rng.choice(users),
+                name=self.get_text(rng),
+                text=self.get_text(rng, 40),
+                cooking_time=rng.randint(1, 999),
+                image=image,
+                image_variants=(
+                    self.get_variants(rng, 'recipes/image') if image else {}
+                ),
+            )
+            # Some recipes have no ingredients at all.
+            IngredientsInRecipe.objects.bulk_create(
+                IngredientsInRecipe(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    amount=rng.randint(1, 10**6),
+                )
+                for ingredient in rng.sample(ingredients, rng.randint(0, 5))
+            )
+            for user in users:
+                if rng.random() < 0.3:
+                    Favorite.objects.create(user=user, recipe=recipe)
+                if rng.random() < 0.3:
+                    ShoppingCart.objects.create(user=user, recipe=recipe)
+        for user in users:
+            for following in users:
+                if user != following and rng.random() < 0.3:
+                    Follow.objects.create(user=user, following=following)
+        return users
+
+    def assert_same_bytes(self, viewer, host):
+        request = Request(
+            RequestFactory().get('/api/recipes/', HTTP_HOST=host)
+        )
+        request.user = viewer
+        context = {'request': request}
+        queryset = Recipe.objects.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(Prefetch(
+            'recipeinlist',
+            queryset=IngredientsInRecipe.objects.select_related(
+                'ingredient'
+            ).order_by('id'),
+        ))
+        self.assertEqual(
+            FastJSONRenderer().render(representations.get_recipes(
+                Recipe.objects.values(*representations.RECIPE_FIELDS),
+                context,
+            )),
+            JSONRenderer().render(
+                RecipeSerializer(queryset, many=True, context=context).data
+            ),
+        )
+        self.assertEqual(
+            FastJSONRenderer().render(representations.get_short_recipes(
+                Recipe.objects.values(*representations.SHORT_RECIPE_FIELDS),
+                context,
+            )),
+            JSONRenderer().render(RecipeShortSerializer(
+                Recipe.objects.all(), many=True, context=context
+            ).data),
+        )
+
+    def test_random_data(self):
+        rng = random.Random(24)
+        for trial in range(10):
+            users = self.create_data(rng, trial)
+            for viewer in [AnonymousUser(), *users]:
+                host = rng.choice(('testserver', '127.0.0.1:8080'))
+                with self.subTest(trial=trial, viewer=str(viewer)):
+                    cache.clear()
+                    self.assert_same_bytes(viewer, host)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class StorageTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.storage = ContentAddressedStorage(location=MEDIA_ROOT)
+
+    def save(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.storage.save('recipes/image.png', ContentFile(data))
+
+    def delete(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+
+    def get_references(self, name):
+        return StoredFile.objects.filter(name=name).values_list(
+            'references', flat=True
+        ).first()
+
+    def test_rollback_leaves_no_file(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ZeroDivisionError), transaction.atomic():
+                name = self.storage.save(
+                    'recipes/image.png', ContentFile(b'rolled back')
+                )
+                1 / 0
+        self.assertFalse(self.storage.exists(name))
+        self.assertIsNone(self.get_references(name))
+
+    def test_references(self):
+        name = self.save(b'shared')
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.save(b'shared'), name)
+        self.assertEqual(self.get_references(name), 2)
+        self.delete(name)
+        self.assertEqual(self.get_references(name), 1)
+        self.assertTrue(self.storage.exists(name))
+        self.delete(name)
+        self.assertIsNone(self.get_references(name))
+        self.assertFalse(self.storage.exists(name))
+
+    def test_saved_again_before_commit(self):
+        name = self.save(b'shared')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+            # Uploaded again before the deletion committed.
+            self.assertEqual(
+                self.storage.save('recipes/image.png', ContentFile(b'shared')),
+                name,
+            )
+        self.assertEqual(self.get_references(name), 1)
+        self.assertTrue(self.storage.exists(name))
+
+
+class ImageUploadTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.user)
+
+    def put_avatar(self, *args, **kwargs):
+        # Files are written to disk when the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put('/api/users/me/avatar/', *args, **kwargs)
+
+    def assert_stripped(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        self.user.refresh_from_db()
+        with self.user.avatar.open() as file:
+            data = file.read()
+        with Image.open(BytesIO(data)) as image:
+            self.assertEqual(dict(image.getexif()), {})
+            # Turned upright, as the orientation tag said.
+            self.assertEqual(image.size, (10, 20))
+        self.assertNotIn(b'Camera', data)
+
+    def test_metadata_stripped_from_base64(self):
+        self.assert_stripped(self.put_avatar(
+            {'avatar': 'data:image/jpeg;base64,' + base64.b64encode(
+                make_photo(20, 10, orientation=6)
+            ).decode()},
+            format='json',
+        ))
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=2 ** 20)
+    def test_size_limit(self):
+        image = make_photo(20, 10)
+        # Bytes after the end of a JPEG are ignored by decoders.
+        fits = image + bytes(2 ** 20 - len(image))
+        too_large = fits + b'\0'
+        error = {'avatar': [ImageUploadHandler.get_size_error()]}
+        for name, send in (
+            ('multipart', lambda data: self.put_avatar(
+                {'avatar': SimpleUploadedFile('photo.jpg', data)},
+                format='multipart',
+            )),
+            ('raw', lambda data: self.put_avatar(
+                data, content_type='image/jpeg'
+            )),
+        ):
+            with self.subTest(name):
+                response = send(too_large)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), error)
+                self.assertEqual(send(fits).status_code, 200)
+
+    def test_metadata_stripped_from_raw_body(self):
+        self.assert_stripped(self.put_avatar(
+            make_photo(20, 10, orientation=6),
+            content_type='image/jpeg',
+        ))
+
+
+class ConditionalGetTests(APITestCase):
+    """Recipe pages answer 304 until something they show has changed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        cls.fan = create_user('fan')
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.data = {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': make_image('red'),
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 10}],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.author).post(
+                '/api/recipes/', self.data, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.recipe_url = f'/api/recipes/{response.json()["id"]}/'
+        self.client = self.client_for(self.reader)
+
+    def get(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        self.assertIn(response.status_code, (200, 304))
+        return response
+
+    def test_not_modified(self):
+        for url in ('/api/recipes/', self.recipe_url):
+            with self.subTest(url=url):
+                response = self.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.get(
+                    url, if_none_match=response['ETag']
+                ).status_code, 304)
+                self.assertEqual(self.get(
+                    url, if_modified_since=response['Last-Modified']
+                ).status_code, 304)
+                self.assertEqual(
+                    self.get(url, if_none_match='"other"').status_code, 200
+                )
+
+    def test_edit(self):
+        etags = {
+            url: self.get(url)['ETag']
+            for url in ('/api/recipes/', self.recipe_url)
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.author).patch(
+                self.recipe_url, {**self.data, 'name': 'Новое название'},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.get(url, if_none_match=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(COUNTERS_REFRESH_INTERVAL=60)
+    def test_favorite_settled(self):
+        clock = mock.Mock()
+        clock.time.return_value = 6010.0
+        with mock.patch('api.conditional.time', clock):
+            etag = self.get('/api/recipes/')['ETag']
+            clock.time.return_value = 6015.0
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client_for(self.fan).post(
+                    f'{self.recipe_url}favorite/'
+                )
+            self.assertEqual(response.status_code, 201)
+            # Within the refresh interval the list stays as it was.
+            clock.time.return_value = 6059.0
+            self.assertEqual(
+                self.get('/api/recipes/', if_none_match=etag).status_code,
+                304,
+            )
+            clock.time.return_value = 6061.0
+            response = self.get('/api/recipes/', if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['favorites_count'], 1)
+
+
+class RelationCacheTests(APITestCase):
+    """The relations cached for a reader never outlive a change."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        cls.recipe, = create_recipes([cls.author], 1, ingredients)
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.reader)
+
+    def get_recipe(self):
+        recipe, = self.client.get('/api/recipes/').json()['results']
+        return recipe
+
+    def change(self, method, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url)
+        self.assertIn(response.status_code, (201, 204))
+
+    def test_favorite(self):
+        url = f'/api/recipes/{self.recipe.pk}/favorite/'
+        self.assertFalse(self.get_recipe()['is_favorited'])
+        self.change('post', url)
+        self.assertTrue(self.get_recipe()['is_favorited'])
+        self.change('delete', url)
+        self.assertFalse(self.get_recipe()['is_favorited'])
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.author.pk}/subscribe/'
+        self.assertFalse(self.get_recipe()['author']['is_subscribed'])
+        self.change('post', url)
+        self.assertTrue(self.get_recipe()['author']['is_subscribed'])
+        self.change('delete', url)
+        self.assertFalse(self.get_recipe()['author']['is_subscribed'])
+
+
+class CounterTests(APITestCase):
+    """Favourite and cart counters of recipes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.readers = [create_user(f'reader{number}') for number in range(3)]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        cls.recipes = create_recipes([cls.author], 2, ingredients)
+
+    def get_counts(self, recipe):
+        return Recipe.objects.filter(pk=recipe.pk).values_list(
+            *counters.COUNTERS
+        ).get()
+
+    def test_add_and_remove(self):
+        recipe = self.recipes[0]
+        for reader in self.readers:
+            Favorite.objects.create(user=reader, recipe=recipe)
+        ShoppingCart.objects.create(user=self.readers[0], recipe=recipe)
+        self.assertEqual(self.get_counts(recipe), (3, 1))
+        Favorite.objects.filter(user=self.readers[0]).delete()
+        ShoppingCart.objects.get(user=self.readers[0]).delete()
+        self.assertEqual(self.get_counts(recipe), (2, 0))
+        self.assertEqual(self.get_counts(self.recipes[1]), (0, 0))
+
+    def test_double_remove(self):
+        recipe = self.recipes[0]
+        client = self.client_for(self.readers[0])
+        url = f'/api/recipes/{recipe.pk}/favorite/'
+        self.assertEqual(client.post(url).status_code, 201)
+        self.assertEqual(client.delete(url).status_code, 204)
+        self.assertEqual(client.delete(url).status_code, 400)
+        self.assertEqual(self.get_counts(recipe), (0, 0))
+        # A decrement the rows do not back, e.g. a repeated signal.
+        counters.change('favorites_count', [recipe.pk], -1)
+        self.assertEqual(self.get_counts(recipe), (0, 0))
+
+    def test_reconcile(self):
+        first, second = self.recipes
+        # Without signals, so the counters drift.
+        Favorite.objects.bulk_create(
+            Favorite(user=reader, recipe=first) for reader in self.readers
+        )
+        Recipe.objects.filter(pk=second.pk).update(in_carts_count=5)
+        ids = [first.pk, second.pk]
+        self.assertEqual(
+            {recipe.pk for recipe in counters.reconcile(ids, fix=False)},
+            set(ids),
+        )
+        self.assertEqual(self.get_counts(first), (0, 0))
+        self.assertEqual(len(counters.reconcile(ids)), 2)
+        self.assertEqual(self.get_counts(first), (3, 0))
+        self.assertEqual(self.get_counts(second), (0, 0))
+        self.assertEqual(counters.reconcile(ids), [])
+
+
+class SimilarTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(12)
+        )
+        cls.recipes = create_recipes([author], 4, ingredients, 0)
+        uses = (
+            ingredients[:8],
+            # Shares seven of the nine ingredients of both.
+            [*ingredients[:7], ingredients[8]],
+            [*ingredients[:4], *ingredients[9:]],
+            ingredients[8:],
+        )
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe, used in zip(cls.recipes, uses)
+            for ingredient in used
+        )
+        similarity.update([recipe.pk for recipe in cls.recipes])
+
+    def test_similar(self):
+        first, close, _, unrelated = self.recipes
+        response = self.client_for().get(f'/api/recipes/{first.pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.json()]
+        self.assertEqual(ids[0], close.pk)
+        self.assertNotIn(unrelated.pk, ids)
+
+
+class ShoppingListExportTests(APITestCase):
+    """The downloads byte for byte."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        salt, pepper = Ingredient.objects.bulk_create((
+            Ingredient(name='Соль, крупная', measurement_unit='г'),
+            Ingredient(name='Перец "чили"', measurement_unit='шт'),
+        ))
+        recipes = create_recipes([cls.user], 2, [salt], 0)
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+            for recipe, ingredient, amount in (
+                (recipes[0], salt, 10),
+                (recipes[1], salt, 20),
+                (recipes[1], pepper, 2),
+            )
+        )
+        for recipe in recipes:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def download(self, file_format):
+        response = self.client_for(self.user).get(
+            '/api/recipes/download_shopping_cart/', {'format': file_format}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping_cart.{file_format}"',
+        )
+        return response['Content-Type'], b''.join(response.streaming_content)
+
+    def test_txt(self):
+        self.assertEqual(self.download('txt'), (
+            'text/plain; charset=utf-8',
+            'Перец "чили" - 2 (шт)\nСоль, крупная - 30 (г)'.encode(),
+        ))
+
+    def test_csv(self):
+        self.assertEqual(self.download('csv'), (
+            'text/csv; charset=utf-8',
+            'name,measurement_unit,amount\r\n'
+            '"Перец ""чили""",шт,2\r\n'
+            '"Соль, крупная",г,30\r\n'.encode(),
+        ))
+
+    def test_json(self):
+        self.assertEqual(self.download('json'), (
+            'application/json; charset=utf-8',
+            '[{"name":"Перец \\"чили\\"","measurement_unit":"шт",'
+            '"amount":2},{"name":"Соль, крупная","measurement_unit":"г",'
+            '"amount":30}]'.encode(),
+        ))
+
+    def test_empty(self):
+        ShoppingCart.objects.all().delete()
+        for file_format in ('txt', 'csv', 'json'):
+            with self.subTest(file_format=file_format):
+                response = self.client_for(self.user).get(
+                    '/api/recipes/download_shopping_cart/',
+                    {'format': file_format},
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class IngredientSearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in (
+                'Морская соль', 'соль', 'Сахар', 'Соль каменная', 'Солод',
+            )
+        )
+
+    def search(self, name, **headers):
+        return self.client_for().get(
+            '/api/ingredients/', {'name': name}, headers=headers
+        )
+
+    def test_ranking(self):
+        # Names starting with the query, then the ones containing it,
+        # both alphabetically and ignoring case.
+        self.assertEqual(
+            [row['name'] for row in self.search('Сол').json()],
+            ['Солод', 'соль', 'Соль каменная', 'Морская соль'],
+        )
+        self.assertEqual(
+            [row['name'] for row in self.search('СОЛЬ').json()],
+            ['соль', 'Соль каменная', 'Морская соль'],
+        )
+
+    def test_etag(self):
+        etag = self.search('сол')['ETag']
+        self.assertEqual(
+            self.search('сол', if_none_match=etag).status_code, 304
+        )
+        self.assertNotEqual(self.search('сах')['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(
+                name='Соль йодированная', measurement_unit='г'
+            )
+        response = self.search('сол', if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'Соль йодированная', [row['name'] for row in response.json()]
+        )
+
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.histograms.flush()
+        cache.clear()
+
+    def test_output(self):
+        with override_settings(METRICS_ENABLED=True):
+            # The middleware stack is built on a client's first request.
+            client = APIClient()
+            queries = 0
+            for _ in range(2):
+                timing = client.get('/api/ingredients/')['Server-Timing']
+                queries += int(re.search(r'"(\d+) queries"', timing)[1])
+            client.post('/api/ingredients/', {})
+        response = metrics.metrics_view(RequestFactory().get('/metrics'))
+        self.assertEqual(
+            response['Content-Type'],
+            'text/plain; version=0.0.4; charset=utf-8'
+        )
+        lines = response.content.decode().splitlines()
+        for name in metrics.HISTOGRAMS:
+            self.assertIn(f'# TYPE {name} histogram', lines)
+        labels = 'view="ingredient-list",method="GET"'
+        buckets = [
+            int(line.rsplit(' ', 1)[1]) for line in lines
+            if line.startswith(f'foodgram_db_queries_bucket{{{labels},')
+        ]
+        self.assertEqual(len(buckets), len(metrics.QUERIES) + 1)
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertIn(
+            f'foodgram_db_queries_bucket{{{labels},le="+Inf"}} 2', lines
+        )
+        self.assertIn(f'foodgram_db_queries_count{{{labels}}} 2', lines)
+        self.assertIn(
+            f'foodgram_db_queries_sum{{{labels}}} {float(queries)}', lines
+        )
+        self.assertIn(
+            'foodgram_view_seconds_count'
+            '{view="ingredient-list",method="POST"} 1',
+            lines
+        )
+
+
+class FeedTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        cls.other_reader = create_user('other_reader')
+        cls.author = create_user('author')
+        cls.popular = create_user('popular')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(5)
+        )
+        cls.recipes = create_recipes([cls.author], 5, ingredients)
+        cls.popular_recipes = create_recipes([cls.popular], 3, ingredients)
+
+    def get_feed_ids(self, client, limit=2):
+        """Ids of the whole feed, page by page along the next links."""
+        ids = []
+        response = client.get('/api/recipes/feed/', {'limit': limit})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            ids += [recipe['id'] for recipe in page['results']]
+            if page['next'] is None:
+                return ids
+            response = client.get(page['next'])
+
+    def expected_ids(self, recipes):
+        return [
+            recipe.pk for recipe in sorted(
+                recipes, key=lambda recipe: (recipe.created, recipe.pk),
+                reverse=True,
+            )
+        ]
+
+    @override_settings(FEED_BACKFILL_LIMIT=3)
+    def test_backfill_and_trim(self):
+        Follow.objects.create(user=self.reader, following=self.author)
+        Follow.objects.create(user=self.reader, following=self.popular)
+        newest = self.expected_ids(self.recipes)[:3]
+        self.assertEqual(
+            sorted(TimelineEntry.objects.filter(
+                user=self.reader
+            ).values_list('recipe_id', 'created')),
+            sorted(Recipe.objects.filter(
+                pk__in=newest + [recipe.pk for recipe in self.popular_recipes]
+            ).values_list('id', 'created')),
+        )
+        Follow.objects.get(user=self.reader, following=self.author).delete()
+        self.assertEqual(
+            self.get_feed_ids(self.client_for(self.reader)),
+            self.expected_ids(self.popular_recipes),
+        )
+
+    @override_settings(FEED_FAN_OUT_MAX_FOLLOWERS=1)
+    def test_fan_in_threshold(self):
+        Follow.objects.create(user=self.reader, following=self.popular)
+        self.popular.refresh_from_db()
+        self.assertFalse(self.popular.feed_fan_in)
+        Follow.objects.create(user=self.other_reader, following=self.popular)
+        self.popular.refresh_from_db()
+        self.assertTrue(self.popular.feed_fan_in)
+        # Followers after the switch read the recipes directly.
+        late_reader = create_user('late_reader')
+        Follow.objects.create(user=late_reader, following=self.popular)
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=late_reader).exists()
+        )
+        recipe = Recipe.objects.create(
+            author=self.popular, name='Новый', text='Описание',
+            image='recipes/test.png', cooking_time=5,
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(recipe=recipe).exists()
+        )
+        expected = self.expected_ids([*self.popular_recipes, recipe])
+        for user in (self.reader, late_reader):
+            with self.subTest(user=user.username):
+                self.assertEqual(
+                    self.get_feed_ids(self.client_for(user)), expected
+                )
+
+    @override_settings(FEED_FAN_OUT_MAX_FOLLOWERS=1)
+    def test_pages_merge_timeline_and_fan_in(self):
+        Follow.objects.create(user=self.other_reader, following=self.popular)
+        Follow.objects.create(user=self.reader, following=self.popular)
+        Follow.objects.create(user=self.reader, following=self.author)
+        # Pairs of recipes tie on ``created``, across both runs too.
+        created = self.recipes[0].created
+        for recipe in Recipe.objects.all():
+            recipe.created = created + timedelta(minutes=recipe.pk // 2)
+            recipe.save(update_fields=['created'])
+            TimelineEntry.objects.filter(recipe=recipe).update(
+                created=recipe.created
+            )
+        recipes = Recipe.objects.all()
+        client = self.client_for(self.reader)
+        for limit in (1, 2, 3, 100):
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    self.get_feed_ids(client, limit),
+                    self.expected_ids(recipes),
+                )
+        first = client.get('/api/recipes/feed/', {'limit': 3}).json()
+        second = client.get(first['next']).json()
+        self.assertEqual(
+            client.get(second['previous']).json()['results'],
+            first['results'],
+        )
+
+
+class ReplicaTests(TransactionTestCase):
+    """Safe requests read from the replica unless they must not."""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        replicas._unavailable.clear()
+        self.reader = create_user('reader')
+        token = Token.objects.create(user=self.reader)
+        User.objects.using('replica').bulk_create([self.reader])
+        Token.objects.using('replica').bulk_create([token])
+        self.credentials = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        # Not replicated yet.
+        author = create_user('author')
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name='Ингредиент', measurement_unit='г')
+        ])
+        self.recipe = create_recipes([author], 1, ingredients, 1)[0]
+
+    def count_users(self, client, **credentials):
+        response = client.get('/api/users/', **credentials)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['count']
+
+    def test_routing(self):
+        self.assertEqual(self.count_users(APIClient()), 1)
+        self.assertEqual(
+            self.count_users(APIClient(), **self.credentials), 1
+        )
+        # Outside requests everything reads from the primary.
+        self.assertEqual(User.objects.count(), 2)
+
+    def replicate_stamps(self):
+        ChangeStamp.objects.using('replica').all().delete()
+        ChangeStamp.objects.using('replica').bulk_create(
+            ChangeStamp.objects.all()
+        )
+
+    def test_conditional_views_follow_stamps(self):
+        client = APIClient()
+        # The replica has not seen the stamps yet.
+        self.assertEqual(client.get('/api/recipes/').json()['count'], 1)
+        self.assertEqual(
+            client.get(f'/api/recipes/{self.recipe.pk}/').status_code, 200
+        )
+        self.replicate_stamps()
+        self.assertEqual(client.get('/api/recipes/').json()['count'], 0)
+        self.assertEqual(
+            client.get(f'/api/recipes/{self.recipe.pk}/').status_code, 404
+        )
+        # A change the replica is behind on.
+        self.recipe.save(update_fields=['name'])
+        self.assertEqual(client.get('/api/recipes/').json()['count'], 1)
+        self.replicate_stamps()
+        self.assertEqual(client.get('/api/recipes/').json()['count'], 0)
+
+    def test_catalog_from_primary(self):
+        self.assertEqual(len(APIClient().get('/api/ingredients/').json()), 1)
+
+    def test_sticky_after_write(self):
+        client = APIClient()
+        response = client.post('/api/recipes/', {}, format='json',
+                               **self.credentials)
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn(replicas.STICKY_COOKIE, response.cookies)
+
+        response = client.post(
+            f'/api/recipes/{self.recipe.pk}/favorite/', **self.credentials
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+        # The cookie, then the marker kept for the credentials.
+        self.assertEqual(self.count_users(client), 2)
+        self.assertEqual(
+            self.count_users(APIClient(), **self.credentials), 2
+        )
+        self.assertEqual(self.count_users(APIClient()), 1)
+        cache.clear()
+        client.cookies.clear()
+        self.assertEqual(self.count_users(client, **self.credentials), 1)
+
+    def test_replica_down(self):
+        client = APIClient()
+        with mock.patch.object(
+            connections['replica'], 'ensure_connection',
+            side_effect=OperationalError('down'),
+        ), self.assertLogs('api.replicas', 'WARNING'):
+            self.assertEqual(self.count_users(client), 2)
+        # Not retried for a while.
+        self.assertEqual(self.count_users(client), 2)
+        replicas._unavailable.clear()
+        self.assertEqual(self.count_users(client), 1)
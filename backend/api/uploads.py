@@ -0,0 +1,202 @@
+"""Image uploads sent as multipart forms or as raw request bodies.
+
+Unlike base64 JSON, these bodies are never held in memory whole: the
+upload handlers below see them chunk by chunk on the way to a temporary
+file. The first chunk must carry a known image signature and the upload
+is cut off as soon as it outgrows ``IMAGE_UPLOAD_MAX_SIZE``; the pixel
+size is then read from the image header, without decoding the pixels.
+
+Whatever the way in, an image that carries EXIF (GPS included), XMP,
+comments or text chunks is encoded again without them before it is
+stored, since the original is served as well as its variants.
+"""
+import base64
+import binascii
+import uuid
+from io import BytesIO
+
+import filetype
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+from drf_extra_fields.fields import Base64ImageField
+from PIL import ExifTags, Image, ImageOps
+from rest_framework import serializers
+from rest_framework.parsers import DataAndFiles, FileUploadParser
+
+from recipes.storage import get_digest, get_name_digest
+
+INVALID_IMAGE = 'Загрузите корректное изображение.'
+
+# Keys of ``Image.info`` that hold metadata besides EXIF.
+METADATA_KEYS = {'xmp', 'XML:com.adobe.xmp', 'comment'}
+
+
+def strip_metadata(file):
+    """``file`` without its metadata, turned upright as EXIF said; a file
+    that has none is returned unchanged."""
+    file.seek(0)
+    with Image.open(file) as image:
+        exif = image.getexif()
+        if not (
+            exif or getattr(image, 'text', None)
+            or METADATA_KEYS & image.info.keys()
+        ):
+            file.seek(0)
+            return file
+        image_format = image.format
+        options = {'icc_profile': image.info.get('icc_profile')}
+        if getattr(image, 'is_animated', False):
+            options['save_all'] = True
+        elif exif.get(ExifTags.Base.Orientation, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+        elif image_format == 'JPEG':
+            # Same quantization: no further loss for an upright photo.
+            options.update(quality='keep', subsampling='keep')
+        if image_format == 'JPEG' and 'quality' not in options:
+            options['quality'] = 95
+        elif image_format == 'GIF':
+            # Otherwise copied over from the original.
+            options['comment'] = b''
+        buffer = BytesIO()
+        image.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue(), name=file.name)
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Checks the uploaded bytes and passes them on unchanged."""
+
+    def __init__(self, request=None, default_field='file'):
+        super().__init__(request)
+        self.default_field = default_field
+
+    def fail(self, message):
+        raise serializers.ValidationError(
+            {self.field_name or self.default_field: [message]}
+        )
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        # Besides the file, a form only carries a few short fields.
+        if content_length and content_length > (
+            settings.IMAGE_UPLOAD_MAX_SIZE
+            + settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        ):
+            self.fail(self.get_size_error())
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and (
+            filetype.guess_extension(raw_data)
+            not in Base64ImageField.ALLOWED_TYPES
+        ):
+            self.fail(INVALID_IMAGE)
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail(self.get_size_error())
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    @staticmethod
+    def get_size_error():
+        return (
+            'Размер изображения не должен превышать '
+            f'{settings.IMAGE_UPLOAD_MAX_SIZE // 2 ** 20} МБ.'
+        )
+
+
+class ImageUploadMixin:
+    """Streams uploads to the viewset's ``image_field`` to disk through
+    :class:`ImageUploadHandler`."""
+
+    image_field = 'file'
+
+    def initial(self, request, *args, **kwargs):
+        self.temporary_file_handler = TemporaryFileUploadHandler(request)
+        request.upload_handlers = [
+            ImageUploadHandler(request, self.image_field),
+            self.temporary_file_handler,
+        ]
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # DRF only passes form uploads on to Django to be closed with the
+        # request, so the temporary file of a raw body is closed here.
+        handler = getattr(self, 'temporary_file_handler', None)
+        if getattr(handler, 'file', None) is not None:
+            handler.file.close()
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ImageUploadParser(FileUploadParser):
+    """The whole body is the image; it is filed under the view's
+    ``image_field``."""
+
+    media_type = 'image/*'
+
+    def get_filename(self, stream, media_type, parser_context):
+        return super().get_filename(
+            stream, media_type, parser_context
+        ) or 'upload'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        field = getattr(parser_context['view'], 'image_field', 'file')
+        return DataAndFiles({}, {field: result.files['file']})
+
+
+class UploadedImageField(Base64ImageField):
+    """Takes either a base64 string or an uploaded image file."""
+
+    def to_internal_value(self, data):
+        unchanged = self.get_unchanged_file(data)
+        if unchanged is not None:
+            return unchanged
+        if not isinstance(data, UploadedFile):
+            return strip_metadata(super().to_internal_value(data))
+        try:
+            with Image.open(data) as image:
+                extension = image.format.lower()
+                width, height = image.size
+        except (OSError, Image.DecompressionBombError):
+            raise serializers.ValidationError(INVALID_IMAGE)
+        if extension not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(INVALID_IMAGE)
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            raise serializers.ValidationError(
+                'Изображение слишком большое: не больше '
+                f'{settings.IMAGE_UPLOAD_MAX_PIXELS // 10 ** 6} Мп.'
+            )
+        data.seek(0)
+        if extension == 'jpeg':
+            extension = 'jpg'
+        data.name = f'{uuid.uuid4()}.{extension}'
+        return strip_metadata(data)
+
+    def get_unchanged_file(self, data):
+        """The instance's current file when ``data`` holds the same bytes,
+        so that sending the image back unchanged neither decodes nor
+        stores it again."""
+        instance = getattr(self.parent, 'instance', None)
+        current = getattr(instance, self.source, None)
+        if not current:
+            return None
+        digest = get_name_digest(current.name)
+        if digest is None:
+            return None
+        if isinstance(data, str):
+            try:
+                data = ContentFile(
+                    base64.b64decode(data.split(';base64,')[-1])
+                )
+            except (binascii.Error, ValueError):
+                return None
+        elif not isinstance(data, UploadedFile):
+            return None
+        if get_digest(data) == digest:
+            return current
+        return None
@@ -1,22 +1,40 @@
-import os
-import tempfile
+from hashlib import md5
+from itertools import chain
 
-from django.db.models import Count, Sum
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Count, Exists, F, OuterRef, Prefetch, Value, Window
+)
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer
 
 from rest_framework.permissions import (
     IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
 )
+from . import conditional, representations, shortlinks
+from .pagination import (
+    CursorOptInMixin,
+    FeedCursorPagination,
+    UserCursorPagination,
+)
 from .permissions import IsAuthorOrReadOnly
+from .renderers import FastJSONRenderer
+from .uploads import ImageUploadMixin, ImageUploadParser
 
 from django_filters.rest_framework import DjangoFilterBackend
-from .filters import RecipeFilter, IngredientFilter
+from .filters import RecipeFilter, RecipeOrderingFilter
+from .exporters import SHOPPING_LIST_RENDERERS
 
 from .serializers import (
     IngredientSerializer,
@@ -28,14 +46,20 @@ from .serializers import (
     PasswordSerializer,
     FollowSerializer,
     ShoppingCartSerializer,
-    AvatarSerializer
+    AvatarSerializer,
+    RecipeImageSerializer,
+    RecipeBatchSerializer,
 )
 
+from recipes import similarity
+from recipes.catalog import ingredient_catalog
+from recipes.signals import changing_in_bulk, relations_bulk_changed
 from recipes.models import (
     Ingredient,
     Recipe,
     Favorite,
     ShoppingCart,
+    ShoppingListItem,
     IngredientsInRecipe
 )
 from users.models import User, Follow
@@ -45,15 +69,47 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = [DjangoFilterBackend]
-    filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        """Autocomplete answered from the in-memory catalog."""
+        name = request.query_params.get('name', '')
+        limit = request.query_params.get('limit', '')
+        if limit.isdigit():
+            limit = int(limit)
+        else:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        version = ingredient_catalog.refresh()
+        etag = quote_etag(
+            md5(f'{version}:{limit}:{name}'.encode()).hexdigest()
+        )
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        response = Response(ingredient_catalog.search(name, limit))
+        response['ETag'] = etag
+        return response
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ImageUploadMixin, CursorOptInMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
+    image_field = 'image'
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, RecipeOrderingFilter]
     filterset_class = RecipeFilter
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_queryset(self):
+        return Recipe.objects.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch(
+                'recipeinlist',
+                queryset=IngredientsInRecipe.objects.select_related(
+                    'ingredient'
+                ).order_by('id'),
+            )
+        )
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -63,17 +119,65 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        user = self.request.user
-        if user.is_authenticated:
-            context['favorited_ids'] = set(
-                Favorite.objects.filter(user=user)
-                .values_list('recipe_id', flat=True)
-            )
-        else:
-            context['favorited_ids'] = set()
-        return context
+    def list(self, request, *args, **kwargs):
+        stamps = conditional.get_stamps(
+            request,
+            scopes=(
+                conditional.RECIPES,
+                conditional.AUTHORS,
+                conditional.INGREDIENTS,
+            ),
+            settled=(conditional.COUNTERS,),
+        )
+        etag, last_modified = conditional.get_validators(
+            request, stamps, key=request.get_full_path()
+        )
+        return conditional.conditional_response(
+            request, etag, last_modified,
+            lambda: self._list_rows(
+                self.filter_queryset(Recipe.objects.all())
+            ),
+        )
+
+    def _list_rows(self, queryset):
+        """``list`` with the page built by ``representations`` from
+        rows instead of by ``RecipeSerializer`` from instances."""
+        # Annotations such as the search rank position the cursor.
+        queryset = queryset.values(
+            *representations.RECIPE_FIELDS, *queryset.query.annotations
+        )
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(representations.get_recipes(queryset, context))
+        return self.get_paginated_response(
+            representations.get_recipes(page, context)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        stamps = conditional.get_stamps(
+            request, scopes=(conditional.AUTHORS, conditional.INGREDIENTS)
+        )
+        row = None
+        if str(kwargs['pk']).isdigit():
+            row = Recipe.objects.filter(pk=kwargs['pk']).values_list(
+                'updated', *Recipe.COUNTER_FIELDS
+            ).first()
+        if row is None:
+            return super().retrieve(request, *args, **kwargs)
+        updated, *counts = row
+        # The counters change without touching ``updated``.
+        etag, last_modified = conditional.get_validators(
+            request, stamps,
+            timestamps=(updated.timestamp(),),
+            key=f'{kwargs["pk"]}:{counts}',
+        )
+        return conditional.conditional_response(
+            request, etag, last_modified,
+            lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
 
     @action(
         detail=True,
@@ -83,12 +187,45 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_name="get-link",
     )
     def get_link(self, request, pk):
-        instance = self.get_object()
+        instance = get_object_or_404(Recipe.objects.only('id'), pk=pk)
 
-        url = f"{request.get_host()}/s/{instance.id}"
+        url = f"{request.get_host()}/r/{shortlinks.encode(instance.id)}"
 
         return Response(data={"short-link": url})
 
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+    )
+    def feed(self, request):
+        # The paginator narrows the recipes to a page of the feed.
+        self._paginator = FeedCursorPagination()
+        return self._list_rows(Recipe.objects.all())
+
+    @action(
+        detail=True,
+        methods=['get'],
+        permission_classes=[AllowAny],
+    )
+    def similar(self, request, pk=None):
+        instance = get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        limit = request.query_params.get('limit', '')
+        limit = min(
+            int(limit) if limit.isdigit() else settings.SIMILAR_RECIPES_LIMIT,
+            settings.SIMILAR_RECIPES_MAX_LIMIT,
+        )
+        ids = similarity.find_similar(instance.id, limit)
+        recipes = {
+            row['id']: row for row in Recipe.objects.filter(
+                pk__in=ids
+            ).values(*representations.SHORT_RECIPE_FIELDS)
+        }
+        return Response(representations.get_short_recipes(
+            [recipes[pk] for pk in ids if pk in recipes],
+            self.get_serializer_context(),
+        ))
+
     @action(
         detail=True,
         methods=['post'],
@@ -112,6 +249,85 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED,
         )
 
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite/batch',
+        url_name='favorite-batch',
+    )
+    def favorite_batch(self, request):
+        return self._handle_batch(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart/batch',
+        url_name='shopping_cart-batch',
+    )
+    def shopping_cart_batch(self, request):
+        return self._handle_batch(request, ShoppingCart)
+
+    def _handle_batch(self, request, model):
+        """Add (POST) or remove (DELETE) several recipes at once.
+
+        One query finds which recipes exist and which of them the user
+        already has, one statement inserts or deletes the rest; the side
+        effects of the rows that were actually inserted or deleted are
+        applied through ``relations_bulk_changed``.
+        """
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+        user = request.user
+        created = request.method == 'POST'
+        with transaction.atomic():
+            present = dict(
+                Recipe.objects.filter(pk__in=recipe_ids).annotate(
+                    present=Exists(model.objects.filter(
+                        user=user, recipe=OuterRef('pk')
+                    ))
+                ).order_by().values_list('id', 'present')
+            )
+            changed = [
+                recipe_id for recipe_id in recipe_ids
+                if present.get(recipe_id) == (not created)
+            ]
+            if changed and created:
+                changed = model.objects.add_missing(user, changed)
+            elif changed:
+                # Rows a concurrent request deleted first are not ours
+                # to count.
+                changed = list(model.objects.select_for_update().filter(
+                    user=user, recipe_id__in=changed
+                ).values_list('recipe_id', flat=True))
+                with changing_in_bulk():
+                    model.objects.filter(
+                        user=user, recipe_id__in=changed
+                    ).delete()
+            if changed:
+                relations_bulk_changed.send(
+                    sender=model,
+                    user_id=user.id,
+                    recipe_ids=changed,
+                    created=created,
+                )
+        changed = set(changed)
+        unchanged = 'exists' if created else 'missing'
+        done = 'added' if created else 'removed'
+        return Response([
+            {
+                'id': recipe_id,
+                'status': (
+                    'not_found' if recipe_id not in present
+                    else done if recipe_id in changed
+                    else unchanged
+                ),
+            }
+            for recipe_id in recipe_ids
+        ])
+
     def _handle_remove_relation(self, request, model):
         recipe = self.get_object()
         user = request.user
@@ -128,6 +344,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path="shopping_cart",
         url_name="shopping_cart",
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk):
         if request.method == "POST":
             return self.recordUsersRecipe(
@@ -174,58 +391,58 @@ class RecipeViewSet(viewsets.ModelViewSet):
         detail=False,
         methods=['get'],
         permission_classes=[IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS,
         url_path='download_shopping_cart',
         url_name='download_shopping_cart'
     )
     def download_shopping_cart(self, request):
-        recipe_ids = ShoppingCart.objects.filter(
+        ingredients = ShoppingListItem.objects.filter(
             user=request.user
-        ).values_list('recipe_id', flat=True)
-
-        ingredients = (
-            IngredientsInRecipe.objects.filter(recipe_id__in=recipe_ids)
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(totalSum=Sum("amount"))
-        )
-
-        if not ingredients:
+        ).values_list(
+            "ingredient__name", "ingredient__measurement_unit", "amount"
+        ).order_by(
+            "ingredient__name", "ingredient__measurement_unit"
+        ).iterator(chunk_size=2000)
+
+        first_row = next(ingredients, None)
+        if first_row is None:
             return Response(
                 {"detail": "Ваша корзина пуста."},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        txtContent = self.convertToTXT(ingredients)
-        return self.responseFromFile(txtContent, file_name='shopping_cart.txt')
-
-    def convertToTXT(self, ingredients):
-        result = []
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
-            amount = ingredient['totalSum']
-            result.append(f"{name} - {amount} ({unit})")
-        return "\n".join(result)
-
-    def responseFromFile(self, text, file_name):
-        fd, path = tempfile.mkstemp(suffix='.txt')
-        try:
-            with os.fdopen(fd, 'w', encoding='utf-8') as tmp:
-                tmp.write(text)
-
-            return FileResponse(
-                open(path, 'rb'),
-                as_attachment=True,
-                filename=file_name,
-                content_type='text/plain'
-            )
-        except Exception as e:
-            raise e
-        finally:
-            pass
 
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(chain([first_row], ingredients)),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{renderer.format}"'
+        )
+        return response
 
-class UserViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    @action(
+        detail=True,
+        methods=['put'],
+        parser_classes=[MultiPartParser, ImageUploadParser],
+    )
+    def image(self, request, pk=None):
+        recipe = self.get_object()
+        serializer = RecipeImageSerializer(recipe, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(
+            {'image': request.build_absolute_uri(recipe.image.url)},
+            status=status.HTTP_200_OK,
+        )
+
+
+class UserViewSet(ImageUploadMixin, CursorOptInMixin,
+                  viewsets.ModelViewSet):
+    queryset = User.objects.order_by('id')
+    image_field = 'avatar'
     permission_classes = [AllowAny]
+    cursor_pagination_class = UserCursorPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -276,8 +493,12 @@ class UserViewSet(viewsets.ModelViewSet):
         user = request.user
         recipes_limit = request.query_params.get('recipes_limit')
 
-        queryset = User.objects.filter(following__user=user) \
-            .annotate(recipes_count=Count('recipe'))
+        queryset = User.objects.filter(following__user=user).annotate(
+            recipes_count=Count('recipe'),
+            is_subscribed=Value(True),
+        ).order_by('username').prefetch_related(
+            self._get_recipes_prefetch(recipes_limit)
+        )
         page = self.paginate_queryset(queryset)
 
         context = self.get_serializer_context()
@@ -300,6 +521,7 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
         Follow.objects.create(user=user, following=author)
+        author.is_subscribed = True
 
         serializer = FollowSerializer(
             author,
@@ -319,6 +541,24 @@ class UserViewSet(viewsets.ModelViewSet):
         follow.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def _get_recipes_prefetch(recipes_limit):
+        """Newest recipes of every author on the page in a single query.
+
+        With ``recipes_limit`` the rows are numbered per author by a
+        window function, so only the first N of each author are fetched.
+        """
+        recipes = Recipe.objects.all()
+        if recipes_limit is not None and recipes_limit.isdigit():
+            recipes = recipes.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F('author'),
+                    order_by=(F('created').desc(), F('id').desc()),
+                )
+            ).filter(row_number__lte=int(recipes_limit))
+        return Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+
     def _get_follow_context(self, request):
         return {
             'request': request,
@@ -329,6 +569,7 @@ class UserViewSet(viewsets.ModelViewSet):
         detail=False,
         methods=['put', 'delete'],
         permission_classes=[IsAuthenticated],
+        parser_classes=[JSONParser, MultiPartParser, ImageUploadParser],
         url_path='me/avatar',
     )
     def avatar(self, request):
@@ -349,7 +590,7 @@ class UserViewSet(viewsets.ModelViewSet):
     def delete_avatar(self, request):
         user = request.user
         if user.avatar:
-            user.avatar.delete(save=False)
+            # The file itself is released by the post_save signal.
             user.avatar = None
             user.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -51,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.TimingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram_backend.urls'
@@ -88,6 +90,54 @@ DATABASES = {
     }
 }
 
+# Read-only replicas of the database, as hosts separated by ', ' that
+# share its name, user and password. Safe requests read from them.
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+    host for host in os.getenv('DB_REPLICA_HOSTS', '').split(', ') if host
+):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# How long a client reads only from the primary after it wrote, to
+# outlast the replication lag, in seconds.
+REPLICA_STICKY_TIMEOUT = int(os.getenv('REPLICA_STICKY_TIMEOUT', 5))
+
+# How long a replica that refused a connection is not tried, in seconds.
+REPLICA_RETRY_TIMEOUT = 30
+
+# Version stamps of the ingredient index, the recipe page validators and
+# the per-user relation ids live in the cache, so production needs one
+# shared by all workers.
+if os.getenv('REDIS_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_LOCATION'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# How long the favourite and cart counters on recipe list pages may lag
+# behind, so that conditional GETs of the pages are not invalidated by
+# every click, in seconds.
+COUNTERS_REFRESH_INTERVAL = 60
+
+# Lifetime of the cached favourite, shopping cart and follow ids of a
+# user, in seconds.
+RELATIONS_CACHE_TIMEOUT = 60 * 60
+
 AUTH_USER_MODEL = 'users.User'
 
 # Password validation
@@ -132,6 +182,15 @@ STATIC_ROOT = BASE_DIR / "static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'recipes.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -152,6 +211,66 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
 
+# Default number of suggestions returned by the ingredient autocomplete,
+# None returns every match.
+INGREDIENT_SEARCH_LIMIT = None
+
+# How long the server caches which recipes short links resolve to, in
+# seconds.
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60 * 24
+# How long browsers and proxies may keep a short link redirect, in
+# seconds; the server drops its copy when the recipe is deleted, they
+# cannot.
+SHORT_LINK_MAX_AGE = 60 * 5
+
+# How long the cursor pagination caches a row count on databases
+# without planner estimates, in seconds.
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+
+# Text search configuration of the PostgreSQL recipe search.
+SEARCH_CONFIG = 'russian'
+# Most matches returned by the in-process search used without
+# PostgreSQL; each becomes a branch of the query's ranking expression.
+SEARCH_FALLBACK_LIMIT = 1000
+
+# Default and largest number of recipes returned by
+# /api/recipes/{id}/similar/.
+SIMILAR_RECIPES_LIMIT = 6
+SIMILAR_RECIPES_MAX_LIMIT = 30
+
+# Authors with more followers than this stop copying their new recipes
+# into the followers' timelines; /api/recipes/feed/ reads their recipes
+# directly instead.
+FEED_FAN_OUT_MAX_FOLLOWERS = 5000
+# How many of an author's newest recipes a new follower's timeline gets.
+FEED_BACKFILL_LIMIT = 100
+
+# Most recipes one request to /api/recipes/favorite/batch/ or
+# /api/recipes/shopping_cart/batch/ may add or remove.
+RELATIONS_BATCH_MAX_SIZE = 100
+
+# Server-Timing headers and per-route histograms served at /metrics.
+# Workers add their observations to the shared cache at most every
+# METRICS_FLUSH_INTERVAL seconds.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+METRICS_FLUSH_INTERVAL = 5
+
+# Longest side, in pixels, of each WebP variant made from recipe images
+# and avatars, and the threads making them; 0 makes them in the request
+# thread right after commit.
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+IMAGE_WEBP_QUALITY = 80
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Limits for images uploaded as multipart forms or raw bodies: the size
+# in bytes (nginx's client_max_body_size) and the pixel count.
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 60 * 10 ** 6
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -0,0 +1,32 @@
+"""Settings for running the test suite without PostgreSQL or Redis:
+
+    python manage.py test --settings=foodgram_backend.test_settings
+"""
+from .settings import *  # noqa: F401, F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    # Not replicated: the tests copy rows to it themselves, and the rows
+    # they leave out stand in for replication lag.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+    },
+}
+DATABASE_REPLICAS = ['replica']
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Image variants are made in the test's own thread once it commits.
+IMAGE_WORKERS = 0
+
+# Tests create many users; the default hasher is deliberately slow.
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
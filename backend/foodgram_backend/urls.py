@@ -1,15 +1,19 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from api.views import RecipeViewSet
+from api import metrics, shortlinks
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
-    path("s/<int:pk>/", RecipeViewSet.as_view({"get": "retrieve"})),
+    re_path(r'^r/(?P<code>[0-9A-Za-z]{1,11})/?$', shortlinks.resolve),
+    re_path(r'^s/(?P<pk>[0-9]{1,19})/?$', shortlinks.resolve_id),
 ]
 
+if settings.METRICS_ENABLED:
+    urlpatterns.append(path('metrics', metrics.metrics_view))
+
 if settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
@@ -10,7 +10,17 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
 
 application = get_wsgi_application()
+
+# Build the ingredient autocomplete index when the worker starts rather
+# than on its first request.
+from recipes.catalog import ingredient_catalog  # noqa: E402
+
+try:
+    ingredient_catalog.refresh()
+except DatabaseError:
+    pass
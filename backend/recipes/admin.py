@@ -1,12 +1,15 @@
 from django.contrib import admin
-from django.db.models import Count
 
+from . import shopping_list, similarity
+from .coverage import count_ingredients
 from .models import (
     Ingredient,
     Recipe,
     IngredientsInRecipe,
     Favorite,
     ShoppingCart,
+    ShoppingListItem,
+    StoredFile,
 )
 
 
@@ -31,7 +34,8 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'name',
         'author',
-        'favorites_count'
+        'favorites_count',
+        'in_carts_count',
     )
     search_fields = (
         'name',
@@ -40,13 +44,17 @@ class RecipeAdmin(admin.ModelAdmin):
     )
     inlines = [IngredientsInRecipeInline]
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        return queryset.annotate(fav_count=Count('recipe_favorite'))
-
-    @admin.display(description='Добавлений в избранное')
-    def favorites_count(self, obj):
-        return obj.fav_count
+    def save_related(self, request, form, formsets, change):
+        recipe_id = form.instance.pk
+        old_amounts = shopping_list.get_recipe_amounts([recipe_id])
+        super().save_related(request, form, formsets, change)
+        count_ingredients([recipe_id])
+        similarity.update([recipe_id])
+        shopping_list.change_recipe(
+            recipe_id,
+            old_amounts,
+            shopping_list.get_recipe_amounts([recipe_id]),
+        )
 
 
 @admin.register(Favorite)
@@ -72,3 +80,68 @@ class IngredientsInRecipeAdmin(admin.ModelAdmin):
         'ingredient',
         'amount',
     )
+
+    def save_model(self, request, obj, form, change):
+        old = None
+        if change:
+            old = IngredientsInRecipe.objects.filter(pk=obj.pk).values_list(
+                'recipe_id', 'ingredient_id', 'amount'
+            ).first()
+        super().save_model(request, obj, form, change)
+        self.rows_changed(old, (obj.recipe_id, obj.ingredient_id, obj.amount))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.rows_changed((obj.recipe_id, obj.ingredient_id, obj.amount), None)
+
+    def delete_queryset(self, request, queryset):
+        rows = list(
+            queryset.values_list('recipe_id', 'ingredient_id', 'amount')
+        )
+        super().delete_queryset(request, queryset)
+        for row in rows:
+            self.rows_changed(row, None)
+
+    def rows_changed(self, old, new):
+        """Update the recipes of the row before (``old``) and after
+        (``new``) the change, both (recipe id, ingredient id, amount)."""
+        recipe_ids = list({row[0] for row in (old, new) if row is not None})
+        count_ingredients(recipe_ids)
+        similarity.update(recipe_ids)
+        for recipe_id in recipe_ids:
+            shopping_list.change_recipe(
+                recipe_id,
+                self.get_amounts(old, recipe_id),
+                self.get_amounts(new, recipe_id),
+            )
+            Recipe.objects.get(pk=recipe_id).save(update_fields=['updated'])
+
+    @staticmethod
+    def get_amounts(row, recipe_id):
+        if row is None or row[0] != recipe_id:
+            return {}
+        return {row[1]: row[2]}
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = (
+        'user',
+        'ingredient',
+        'amount',
+    )
+
+
+@admin.register(StoredFile)
+class StoredFileAdmin(admin.ModelAdmin):
+    list_display = (
+        'name',
+        'references',
+    )
+    search_fields = (
+        'name',
+    )
+    readonly_fields = (
+        'name',
+        'references',
+    )
@@ -0,0 +1,109 @@
+"""In-process copy of the ingredient catalog for autocomplete.
+
+The catalog is small (a few thousand rows) and read on every keystroke,
+so each worker keeps it in memory, sorted by case-folded name. Changes
+bump a version stored in the cache framework; a worker notices the new
+version on its next lookup and rebuilds its copy.
+"""
+import threading
+import uuid
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Ingredient
+
+VERSION_CACHE_KEY = 'ingredient-catalog-version'
+
+
+def bump_version():
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+class IngredientCatalog:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []
+        self._entries = []
+        self._by_id = {}
+
+    @property
+    def is_built(self):
+        return self._version is not None
+
+    def refresh(self):
+        """Rebuild the index if the catalog changed; return its version."""
+        version = cache.get_or_set(
+            VERSION_CACHE_KEY, lambda: uuid.uuid4().hex, None
+        )
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build()
+                    self._version = version
+        return version
+
+    def _build(self):
+        # From the primary: a replica may not have the change that
+        # bumped the version yet.
+        rows = Ingredient.objects.using(DEFAULT_DB_ALIAS).values_list(
+            'id', 'name', 'measurement_unit'
+        )
+        entries = sorted(
+            (name.casefold(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in rows
+        )
+        self._keys = [entry[0] for entry in entries]
+        self._entries = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in entries
+        ]
+        self._by_id = {entry['id']: entry for entry in self._entries}
+
+    def search(self, query='', limit=None):
+        """Ingredients whose name starts with ``query``, then the ones
+        that merely contain it, both in alphabetical order."""
+        self.refresh()
+        keys, entries = self._keys, self._entries
+        query = query.strip().casefold()
+        if not query:
+            return entries[:limit]
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        result = entries[start:end]
+        if limit is not None and len(result) >= limit:
+            return result[:limit]
+        for index, key in enumerate(keys):
+            if query in key and not start <= index < end:
+                result.append(entries[index])
+                if len(result) == limit:
+                    break
+        return result
+
+    def get_many(self, ids):
+        """Catalog entries for ``ids`` that exist, keyed by id."""
+        self.refresh()
+        return {pk: self._by_id[pk] for pk in ids if pk in self._by_id}
+
+
+ingredient_catalog = IngredientCatalog()
+
+
+def get_ingredients(ids):
+    """Ingredients with ``ids`` that exist, keyed by id: from the
+    in-memory catalog once this worker has built it, otherwise with one
+    query."""
+    if not ingredient_catalog.is_built:
+        return Ingredient.objects.in_bulk(ids)
+    fields = ('id', 'name', 'measurement_unit')
+    return {
+        pk: Ingredient.from_db(
+            DEFAULT_DB_ALIAS, fields, [entry[field] for field in fields]
+        )
+        for pk, entry in ingredient_catalog.get_many(ids).items()
+    }
@@ -0,0 +1,60 @@
+"""Denormalized popularity counters of recipes.
+
+``Recipe.favorites_count`` and ``Recipe.in_carts_count`` are moved by
+one in the same transaction as the favourite or cart row, with an
+``UPDATE ... SET count = count + 1`` that cannot lose a concurrent
+change. ``reconcile`` recounts them from the rows for the cases the
+signals do not see, such as bulk inserts and raw SQL.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Favorite, Recipe, ShoppingCart
+
+# Counter field -> model whose rows it counts.
+COUNTERS = {
+    'favorites_count': Favorite,
+    'in_carts_count': ShoppingCart,
+}
+
+
+def change(field, recipe_ids, delta):
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def count(model, recipe_ids):
+    return dict(
+        model.objects.filter(recipe_id__in=recipe_ids).order_by().values(
+            'recipe_id'
+        ).annotate(count=Count('*')).values_list('recipe_id', 'count')
+    )
+
+
+def reconcile(recipe_ids, fix=True):
+    """Recount the counters of ``recipe_ids``; return the recipes whose
+    stored counters were off, saving the right values when ``fix``."""
+    with transaction.atomic():
+        recipes = list(
+            Recipe.objects.select_for_update().filter(pk__in=recipe_ids)
+            .only('id', *COUNTERS)
+        )
+        actual = {
+            field: count(model, recipe_ids)
+            for field, model in COUNTERS.items()
+        }
+        drifted = []
+        for recipe in recipes:
+            changed = False
+            for field in COUNTERS:
+                value = actual[field].get(recipe.pk, 0)
+                if getattr(recipe, field) != value:
+                    setattr(recipe, field, value)
+                    changed = True
+            if changed:
+                drifted.append(recipe)
+        if fix and drifted:
+            Recipe.objects.bulk_update(drifted, list(COUNTERS))
+    return drifted
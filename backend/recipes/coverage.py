@@ -0,0 +1,69 @@
+"""Recipes by the ingredients at hand.
+
+``IngredientsInRecipe`` serves as an inverted index: with the index on
+``(ingredient, recipe)`` the rows of the requested ingredients are the
+postings of the recipes using them, and one pass over them, grouped by
+recipe, counts the matches. Comparing that with the denormalized
+``ingredients_count`` gives the missing ingredients, so the rows of
+recipes that share nothing with the request are never read.
+"""
+from django.db.models import (
+    Count,
+    Exists,
+    F,
+    IntegerField,
+    OuterRef,
+    Subquery,
+)
+from django.db.models.functions import Coalesce
+
+from .models import IngredientsInRecipe, Recipe
+
+
+def filter_by_ingredients(queryset, ingredient_ids, missing=0):
+    """Recipes that need at most ``missing`` ingredients besides
+    ``ingredient_ids``, best covered first.
+
+    The order leads with the ``missing_count`` annotation, which cursor
+    pages are positioned on.
+    """
+    ingredient_ids = list(set(ingredient_ids))
+    return queryset.filter(
+        recipeinlist__ingredient_id__in=ingredient_ids,
+        ingredients_count__lte=len(ingredient_ids) + missing,
+    ).annotate(
+        matched_count=Count('recipeinlist'),
+        missing_count=F('ingredients_count') - F('matched_count'),
+    ).filter(
+        missing_count__lte=missing,
+    ).order_by(
+        'missing_count', '-matched_count', *Recipe._meta.ordering
+    )
+
+
+def exclude_ingredients(queryset, ingredient_ids):
+    """Recipes that use none of ``ingredient_ids``."""
+    return queryset.exclude(Exists(
+        IngredientsInRecipe.objects.filter(
+            recipe_id=OuterRef('pk'), ingredient_id__in=ingredient_ids
+        )
+    ))
+
+
+def count_ingredients(recipe_ids=None):
+    """Recalculate ``ingredients_count`` of ``recipe_ids`` (all recipes
+    when None)."""
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    recipes.update(ingredients_count=Coalesce(
+        Subquery(
+            IngredientsInRecipe.objects.filter(
+                recipe_id=OuterRef('pk')
+            ).order_by().values('recipe_id').annotate(
+                count=Count('*')
+            ).values('count'),
+            output_field=IntegerField(),
+        ),
+        0,
+    ))
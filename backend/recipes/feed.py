@@ -0,0 +1,134 @@
+"""Subscription feed: new recipes of the authors a user follows.
+
+Most authors have few followers, so their recipes are copied into a
+``TimelineEntry`` per follower when published (fan-out on write) and a
+feed is read from the user's own timeline. Copying stops paying off for
+an author with very many followers: each recipe would write that many
+rows. Once an author passes ``FEED_FAN_OUT_MAX_FOLLOWERS`` the author is
+marked ``feed_fan_in`` and the feed query reads that author's recipes
+directly (fan-in on read), alongside the timeline.
+
+A timeline entry carries a copy of the recipe's ``created``, so a page
+of the timeline is one range of its (user, -created, -recipe) index.
+The fan-in authors' recipes are read along the (author, -created, -id)
+index of recipes, and the two runs are merged in Python.
+
+Following an author copies the author's newest recipes into the
+follower's timeline; unfollowing removes them.
+"""
+from heapq import merge
+
+from django.conf import settings
+from django.db.models import Q
+
+from users.models import Follow, User
+
+from .models import Recipe, TimelineEntry
+
+
+def fan_out(recipe):
+    """Copy a new recipe into the timelines of the author's followers."""
+    if User.objects.filter(pk=recipe.author_id, feed_fan_in=True).exists():
+        return
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id, recipe_id=recipe.id, created=recipe.created
+            )
+            for user_id in Follow.objects.filter(
+                following_id=recipe.author_id
+            ).values_list('user_id', flat=True).iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def follow(user_id, author_id):
+    """Fill the follower's timeline with the author's newest recipes and
+    switch the author to fan-in once there are too many followers."""
+    if User.objects.filter(pk=author_id, feed_fan_in=True).exists():
+        return
+    backfill(user_id, author_id)
+    if has_too_many_followers(author_id):
+        User.objects.filter(pk=author_id).update(feed_fan_in=True)
+
+
+def backfill(user_id, author_id):
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id, recipe_id=recipe_id, created=created
+            )
+            for recipe_id, created in Recipe.objects.filter(
+                author_id=author_id
+            ).values_list('id', 'created')[:settings.FEED_BACKFILL_LIMIT]
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def has_too_many_followers(author_id):
+    limit = settings.FEED_FAN_OUT_MAX_FOLLOWERS
+    return Follow.objects.filter(
+        following_id=author_id
+    )[:limit + 1].count() > limit
+
+
+def unfollow(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def get_sources(user):
+    """The timeline entries of ``user`` and the recipes of the fan-in
+    authors ``user`` follows, which together make up the feed."""
+    return (
+        TimelineEntry.objects.filter(user=user),
+        Recipe.objects.filter(author_id__in=Follow.objects.filter(
+            user=user, following__feed_fan_in=True
+        ).values('following_id')),
+    )
+
+
+def get_feed(queryset, user, position=None, reverse=False, size=None):
+    """Recipes of ``queryset`` in the feed of ``user`` that can be among
+    the ``size`` newest published before ``position``, or the ``size``
+    oldest published after it when ``reverse``."""
+    sign, lookup = ('', 'created__gt') if reverse else ('-', 'created__lt')
+    bound = {} if position is None else {lookup: position}
+    timeline, fan_in = get_sources(user)
+    timeline = timeline.filter(**bound).order_by(
+        f'{sign}created', f'{sign}recipe_id'
+    ).values_list('created', 'recipe_id')
+    fan_in = fan_in.filter(**bound).order_by(
+        f'{sign}created', f'{sign}id'
+    ).values_list('created', 'id')
+    # A recipe may be in both runs: its author turned fan-in after it
+    # was copied into the timeline.
+    ids = list(dict.fromkeys(
+        pk for _, pk in merge(
+            timeline[:size], fan_in[:size], reverse=not reverse
+        )
+    ))[:size]
+    return queryset.filter(pk__in=ids)
+
+
+def rebuild():
+    """Refill every timeline from the current follows."""
+    TimelineEntry.objects.all().delete()
+    for author_id, fan_in in User.objects.filter(
+        Q(following__isnull=False) | Q(feed_fan_in=True)
+    ).distinct().values_list('id', 'feed_fan_in'):
+        should_fan_in = has_too_many_followers(author_id)
+        if should_fan_in != fan_in:
+            User.objects.filter(pk=author_id).update(
+                feed_fan_in=should_fan_in
+            )
+        if should_fan_in:
+            continue
+        for user_id in Follow.objects.filter(
+            following_id=author_id
+        ).values_list('user_id', flat=True):
+            backfill(user_id, author_id)
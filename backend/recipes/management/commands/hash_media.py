@@ -0,0 +1,42 @@
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.signals import FILE_FIELDS
+from recipes.storage import is_hashed
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки, загруженные до перехода на хранение по хешу '
+        'содержимого, под новые имена, объединяя одинаковые файлы.'
+    )
+
+    def handle(self, *args, **options):
+        for model, field_name in FILE_FIELDS.items():
+            rows = defaultdict(list)
+            for pk, name in model.objects.values_list('pk', field_name):
+                if name and not is_hashed(name):
+                    rows[name].append(pk)
+            moved = 0
+            for name, pks in rows.items():
+                if not default_storage.exists(name):
+                    self.stderr.write(f'Файл {name} не найден.')
+                    continue
+                with transaction.atomic():
+                    for pk in pks:
+                        with default_storage.open(name) as file:
+                            new_name = default_storage.save(name, file)
+                        model.objects.filter(pk=pk).update(
+                            **{field_name: new_name}
+                        )
+                    default_storage.delete(name)
+                moved += len(pks)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {moved}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Готово. Уменьшенные копии пересоздаёт build_image_variants.'
+        ))
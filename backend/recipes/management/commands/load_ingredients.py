@@ -0,0 +1,144 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.catalog import bump_version
+from recipes.models import Ingredient
+
+DEFAULT_FILE = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def normalize(value):
+    return ' '.join(str(value).split())
+
+
+def get_key(name, measurement_unit):
+    return name.casefold(), measurement_unit.casefold()
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    """Yield the objects of a top-level JSON array without loading it."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив ингредиентов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Файл JSON оборвался.')
+            buffer += chunk
+            continue
+        yield item['name'], item['measurement_unit']
+        buffer = buffer[end:]
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV или JSON, пропуская уже '
+        'существующие. Повторный запуск ничего не меняет.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_FILE)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, path, batch_size, **options):
+        path = Path(path)
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Неизвестный формат файла: {path.suffix}')
+
+        start = time.perf_counter()
+        seen = {
+            get_key(normalize(name), normalize(unit))
+            for name, unit in Ingredient.objects.values_list(
+                'name', 'measurement_unit'
+            ).iterator()
+        }
+        read = created = 0
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            new_rows = self.get_new_rows(reader(file), seen)
+            while batch := list(islice(new_rows, batch_size)):
+                created += self.insert(batch)
+            read = self.read_count
+            if created:
+                transaction.on_commit(bump_version)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {read}, добавлено {created} ингредиентов '
+            f'за {elapsed:.3f} с ({read / elapsed:.0f} строк/с).'
+        ))
+
+    def get_new_rows(self, rows, seen):
+        self.read_count = 0
+        for name, unit in rows:
+            self.read_count += 1
+            name, unit = normalize(name), normalize(unit)
+            key = get_key(name, unit)
+            if not name or not unit or key in seen:
+                continue
+            seen.add(key)
+            yield name, unit
+
+    def insert(self, rows):
+        if connection.vendor == 'postgresql':
+            return self.copy(rows)
+        before = Ingredient.objects.count()
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name, measurement_unit=unit)
+             for name, unit in rows],
+            ignore_conflicts=True,
+        )
+        return Ingredient.objects.count() - before
+
+    def copy(self, rows):
+        """COPY the batch into a staging table and merge it in one go."""
+        table = Ingredient._meta.db_table
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS ingredient_staging '
+                '(name varchar(128), measurement_unit varchar(64)) '
+                'ON COMMIT DROP'
+            )
+            cursor.execute('TRUNCATE ingredient_staging')
+            cursor.copy_expert(
+                'COPY ingredient_staging (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_staging '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            return cursor.rowcount
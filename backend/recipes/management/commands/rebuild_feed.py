@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново заполняет ленты подписок по текущим подпискам и '
+        'пересматривает, каким авторам собирать ленту при чтении.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            feed.rebuild()
+        self.stdout.write(self.style.SUCCESS('Ленты подписок обновлены.'))
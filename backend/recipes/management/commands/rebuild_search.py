@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает поисковые векторы всех рецептов (PostgreSQL) или '
+        'сбрасывает поисковый индекс в памяти воркеров.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.update()
+        self.stdout.write(self.style.SUCCESS('Поиск по рецептам обновлён.'))
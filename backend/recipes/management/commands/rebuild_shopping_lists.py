@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сводные списки покупок пользователей по их корзинам '
+        'или, с --verify, только сверяет их.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохранённые списки с корзинами.',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Ограничиться пользователем с этим id (можно повторять).',
+        )
+
+    def handle(self, *args, verify, user_ids, **options):
+        if not verify:
+            with transaction.atomic():
+                shopping_list.rebuild(user_ids)
+            self.stdout.write(
+                self.style.SUCCESS('Списки покупок пересчитаны.')
+            )
+            return
+
+        live = shopping_list.get_live_totals(user_ids)
+        stored = shopping_list.get_stored_totals(user_ids)
+        mismatches = sorted(
+            key for key in live.keys() | stored.keys()
+            if live.get(key) != stored.get(key)
+        )
+        for user_id, ingredient_id in mismatches:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'сохранено {stored.get((user_id, ingredient_id))}, '
+                f'в корзине {live.get((user_id, ingredient_id))}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Расхождений нет, позиций: {len(live)}.'
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from recipes import similarity
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает корзины похожих рецептов по их ингредиентам '
+        'пачками рецептов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько рецептов пересчитывать за одну транзакцию.',
+        )
+
+    def handle(self, *args, batch_size, **options):
+        done = 0
+        last_id = 0
+        while True:
+            batch = list(
+                Recipe.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            similarity.update(batch)
+            done += len(batch)
+            last_id = batch[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны: {done}.'
+        ))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import counters
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики избранного и списков покупок рецептов '
+        'пачками и исправляет расхождения или, с --verify, только '
+        'сообщает о них.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только проверить счётчики.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько рецептов пересчитывать за одну транзакцию.',
+        )
+
+    def handle(self, *args, verify, batch_size, **options):
+        drifted = checked = 0
+        last_id = 0
+        while True:
+            batch = list(
+                Recipe.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            drifted += len(counters.reconcile(batch, fix=not verify))
+            checked += len(batch)
+            last_id = batch[-1]
+        if verify and drifted:
+            raise CommandError(
+                f'Счётчики расходятся у {drifted} из {checked} рецептов.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено рецептов: {checked}, исправлено: '
+            f'{0 if verify else drifted}.'
+        ))
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:08
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Keep the oldest of the ingredients with the same name and unit and
+    move the recipe and shopping list rows of the others to it."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientsInRecipe = apps.get_model('recipes', 'IngredientsInRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(count=Count('*'), first_id=Min('id')).filter(
+        count__gt=1
+    ).order_by()
+    for duplicate in duplicates:
+        survivor_id = duplicate['first_id']
+        others = list(Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(pk=survivor_id).values_list('id', flat=True))
+        # Both tables are unique per (owner, ingredient): amounts of an
+        # owner that already has the survivor are added to its row.
+        for model, owner in (
+            (IngredientsInRecipe, 'recipe_id'),
+            (ShoppingListItem, 'user_id'),
+        ):
+            rows = {
+                getattr(row, owner): row
+                for row in model.objects.filter(ingredient_id=survivor_id)
+            }
+            for row in model.objects.filter(ingredient_id__in=others):
+                kept = rows.get(getattr(row, owner))
+                if kept is None:
+                    row.ingredient_id = survivor_id
+                    row.save(update_fields=['ingredient'])
+                    rows[getattr(row, owner)] = row
+                else:
+                    kept.amount += row.amount
+                    kept.save(update_fields=['amount'])
+                    row.delete()
+        Ingredient.objects.filter(pk__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AlterUniqueTogether(
+            name='ingredient',
+            unique_together={('name', 'measurement_unit')},
+        ),
+    ]
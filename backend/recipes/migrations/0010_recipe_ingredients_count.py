@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:33
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_ingredients_count(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientsInRecipe = apps.get_model('recipes', 'IngredientsInRecipe')
+    Recipe.objects.update(ingredients_count=Coalesce(
+        Subquery(
+            IngredientsInRecipe.objects.filter(
+                recipe_id=OuterRef('pk')
+            ).order_by().values('recipe_id').annotate(
+                count=Count('*')
+            ).values('count'),
+            output_field=IntegerField(),
+        ),
+        0,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число ингредиентов'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredientsinrecipe',
+            index=models.Index(fields=['ingredient', 'recipe'], name='ingredient_recipe_idx'),
+        ),
+        migrations.RunPython(fill_ingredients_count, migrations.RunPython.noop),
+    ]
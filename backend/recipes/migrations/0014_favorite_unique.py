@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:50
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_favorites(apps, schema_editor):
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    duplicates = Favorite.objects.values('user_id', 'recipe_id').annotate(
+        count=Count('*'), first_id=Min('id')
+    ).filter(count__gt=1).order_by()
+    for duplicate in duplicates:
+        Favorite.objects.filter(
+            user_id=duplicate['user_id'], recipe_id=duplicate['recipe_id']
+        ).exclude(pk=duplicate['first_id']).delete()
+        Recipe.objects.filter(pk=duplicate['recipe_id']).update(
+            favorites_count=F('favorites_count') - (duplicate['count'] - 1)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_timelineentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_favorites, migrations.RunPython.noop
+        ),
+        migrations.AlterUniqueTogether(
+            name='favorite',
+            unique_together={('user', 'recipe')},
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.3 on 2026-10-18 05:12
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_carts(apps, schema_editor):
+    """Keep one cart row per user and recipe and take the recipe's
+    ingredients of the others off the user's shopping list."""
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    IngredientsInRecipe = apps.get_model('recipes', 'IngredientsInRecipe')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    duplicates = ShoppingCart.objects.values(
+        'user_id', 'recipe_id'
+    ).annotate(count=Count('*'), first_id=Min('id')).filter(
+        count__gt=1
+    ).order_by()
+    for duplicate in duplicates:
+        extra = duplicate['count'] - 1
+        ShoppingCart.objects.filter(
+            user_id=duplicate['user_id'], recipe_id=duplicate['recipe_id']
+        ).exclude(pk=duplicate['first_id']).delete()
+        Recipe.objects.filter(pk=duplicate['recipe_id']).update(
+            in_carts_count=F('in_carts_count') - extra
+        )
+        for ingredient_id, amount in IngredientsInRecipe.objects.filter(
+            recipe_id=duplicate['recipe_id']
+        ).values_list('ingredient_id', 'amount'):
+            item = ShoppingListItem.objects.filter(
+                user_id=duplicate['user_id'], ingredient_id=ingredient_id
+            ).first()
+            if item is None:
+                continue
+            item.amount -= amount * extra
+            if item.amount > 0:
+                item.save(update_fields=['amount'])
+            else:
+                item.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_favorite_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_carts, migrations.RunPython.noop
+        ),
+        migrations.AlterUniqueTogether(
+            name='shoppingcart',
+            unique_together={('user', 'recipe')},
+        ),
+    ]
@@ -1,8 +1,22 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models
 from users.models import User
 
 
+class SearchVectorIndex(GinIndex):
+    """GIN index on PostgreSQL; other databases, which keep no search
+    vectors, get a plain index so that migrations run everywhere."""
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using, **kwargs)
+        return models.Index.create_sql(
+            self, model, schema_editor, using, **kwargs
+        )
+
+
 class Ingredient(models.Model):
     name = models.CharField(max_length=128, verbose_name='Название')
     measurement_unit = models.CharField(
@@ -13,6 +27,10 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        unique_together = (
+            'name',
+            'measurement_unit'
+        )
 
     def __str__(self):
         return self.name
@@ -30,6 +48,10 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Картинка'
     )
+    image_variants = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name='Уменьшенные копии картинки'
+    )
     cooking_time = models.IntegerField(
         validators=[MinValueValidator(1)],
         verbose_name='Время приготовления'
@@ -39,14 +61,75 @@ class Recipe(models.Model):
         through='IngredientsInRecipe',
         verbose_name='Рецепты'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата публикации'
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Добавлений в избранное'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Добавлений в списки покупок'
+    )
+    ingredients_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Число ингредиентов'
+    )
+    search_vector = SearchVectorField(
+        null=True, editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    # Only ever changed with UPDATE ... SET count = count + 1.
+    COUNTER_FIELDS = ('favorites_count', 'in_carts_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        ordering = ('-created', '-id')
+        indexes = [
+            models.Index(
+                fields=['-created', '-id'], name='recipe_created_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-created', '-id'],
+                name='recipe_author_created_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-created', '-id'],
+                name='recipe_favorites_idx'
+            ),
+            models.Index(
+                fields=['-in_carts_count', '-created', '-id'],
+                name='recipe_in_carts_idx'
+            ),
+            SearchVectorIndex(
+                fields=['search_vector'], name='recipe_search_vector_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Writing back the counters loaded with the recipe would undo the
+        # favourites added since.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
 class IngredientsInRecipe(models.Model):
     recipe = models.ForeignKey(
@@ -70,6 +153,47 @@ class IngredientsInRecipe(models.Model):
             'recipe',
             'ingredient'
         )
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='ingredient_recipe_idx'
+            ),
+        ]
+
+
+class UserRecipeQuerySet(models.QuerySet):
+
+    def add_missing(self, user, recipe_ids):
+        """Insert the rows of ``user`` and ``recipe_ids``, skipping those
+        that exist, a concurrent request's included; return the ids of
+        the recipes whose rows were inserted."""
+        self._for_write = True
+        connection = connections[self.db]
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # Old SQLite, which lets one transaction write at a time.
+            self.bulk_create(
+                [self.model(user=user, recipe_id=pk) for pk in recipe_ids],
+                ignore_conflicts=True,
+            )
+            return list(recipe_ids)
+        # bulk_create(ignore_conflicts=True) does not tell which rows it
+        # skipped, RETURNING does (PostgreSQL, SQLite 3.35+).
+        quote_name = connection.ops.quote_name
+        table = quote_name(self.model._meta.db_table)
+        user_column, recipe_column = (
+            quote_name(self.model._meta.get_field(name).column)
+            for name in ('user', 'recipe')
+        )
+        values = ', '.join(['(%s, %s)'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({user_column}, {recipe_column}) '
+                f'VALUES {values} ON CONFLICT DO NOTHING '
+                f'RETURNING {recipe_column}',
+                [value for pk in recipe_ids for value in (user.pk, pk)],
+            )
+            inserted = {row[0] for row in cursor.fetchall()}
+        return [pk for pk in recipe_ids if pk in inserted]
 
 
 class Favorite(models.Model):
@@ -86,9 +210,12 @@ class Favorite(models.Model):
         related_name='recipe_favorite'
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+        unique_together = ('user', 'recipe')
 
 
 class RecipesOfUsers(models.Model):
@@ -103,6 +230,8 @@ class RecipesOfUsers(models.Model):
         verbose_name='Рецепт',
     )
 
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         abstract = True
         unique_together = ('user', 'recipe')
@@ -124,3 +253,100 @@ class ShoppingCart(RecipesOfUsers):
     class Meta():
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
+        unique_together = ('user', 'recipe')
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        unique_together = (
+            'user',
+            'ingredient'
+        )
+
+
+class StoredFile(models.Model):
+    name = models.CharField(
+        max_length=255, unique=True,
+        verbose_name='Путь'
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок'
+    )
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
+
+
+class SimilarityBucket(models.Model):
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='similarity_buckets',
+        verbose_name='Рецепт'
+    )
+    band = models.PositiveSmallIntegerField(verbose_name='Полоса')
+    bucket = models.BigIntegerField(verbose_name='Корзина')
+
+    class Meta:
+        verbose_name = 'Корзина похожих рецептов'
+        verbose_name_plural = 'Корзины похожих рецептов'
+        unique_together = (
+            'recipe',
+            'band'
+        )
+        indexes = [
+            models.Index(
+                fields=['band', 'bucket'], name='similarity_bucket_idx'
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    # A copy of the recipe's, so a page of the feed is one index range.
+    created = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        unique_together = (
+            'user',
+            'recipe'
+        )
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-recipe'],
+                name='timeline_user_created_idx',
+            ),
+        ]
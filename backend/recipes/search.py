@@ -0,0 +1,157 @@
+"""Full-text search over recipe names and descriptions.
+
+On PostgreSQL every recipe keeps a ``search_vector`` (the name weighted
+above the text) behind a GIN index; it is refreshed whenever the recipe
+is saved and matches are ranked with ``ts_rank``. Other databases, i.e.
+SQLite in local development, use an in-process inverted index that is
+rebuilt the same way as the ingredient catalog: saving or deleting a
+recipe bumps a version in the cache and each worker rebuilds its copy on
+its next search. Only the ``SEARCH_FALLBACK_LIMIT`` best matches are
+returned there, ranked by their position.
+
+Either way the matches carry a ``rank`` annotation, so cursor pages
+follow the ranking.
+"""
+import re
+import threading
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Case, F, IntegerField, When
+
+from .models import Recipe
+
+VERSION_CACHE_KEY = 'recipe-search-version'
+TOKEN = re.compile(r'\w+')
+# ts_rank's default weights of the A (name) and B (text) labels.
+NAME_WEIGHT = 1.0
+TEXT_WEIGHT = 0.4
+
+
+def uses_vectors(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def get_vector():
+    return (
+        SearchVector('name', weight='A', config=settings.SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=settings.SEARCH_CONFIG)
+    )
+
+
+def bump_version():
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def update(recipe_ids=None):
+    """Bring the search data of ``recipe_ids`` (all recipes when None)
+    in line with their names and texts."""
+    if not uses_vectors():
+        transaction.on_commit(bump_version)
+        return
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    recipes.update(search_vector=get_vector())
+
+
+def search_recipes(queryset, query):
+    """Recipes of ``queryset`` matching every word of ``query``, the
+    most relevant first."""
+    if uses_vectors(queryset.db):
+        query = SearchQuery(
+            query, config=settings.SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', *Recipe._meta.ordering)
+    ids = recipe_index.search(query)[:settings.SEARCH_FALLBACK_LIMIT]
+    return queryset.filter(pk__in=ids).annotate(
+        rank=Case(
+            *(
+                When(pk=pk, then=len(ids) - position)
+                for position, pk in enumerate(ids)
+            ),
+            output_field=IntegerField(),
+        )
+    ).order_by('-rank', *Recipe._meta.ordering)
+
+
+def tokenize(text):
+    return TOKEN.findall(text.casefold())
+
+
+class RecipeIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._tokens = []
+        self._postings = {}
+
+    def refresh(self):
+        """Rebuild the index if recipes changed; return its version."""
+        version = cache.get_or_set(
+            VERSION_CACHE_KEY, lambda: uuid.uuid4().hex, None
+        )
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build()
+                    self._version = version
+        return version
+
+    def _build(self):
+        postings = defaultdict(lambda: defaultdict(float))
+        # From the primary, like the ingredient catalog.
+        for pk, name, text in Recipe.objects.using(
+            DEFAULT_DB_ALIAS
+        ).values_list('id', 'name', 'text').iterator():
+            for token in tokenize(name):
+                postings[token][pk] += NAME_WEIGHT
+            for token in tokenize(text):
+                postings[token][pk] += TEXT_WEIGHT
+        self._postings = {
+            token: dict(scores) for token, scores in postings.items()
+        }
+        self._tokens = sorted(self._postings)
+
+    def _match(self, word):
+        # Words match as prefixes, standing in for the stemming that
+        # PostgreSQL does.
+        scores = defaultdict(float)
+        start = bisect_left(self._tokens, word)
+        for token in self._tokens[start:]:
+            if not token.startswith(word):
+                break
+            for pk, score in self._postings[token].items():
+                scores[pk] += score
+        return scores
+
+    def search(self, query):
+        """Ids of recipes containing every word of ``query``, by
+        descending score."""
+        self.refresh()
+        words = tokenize(query)
+        if not words:
+            return []
+        scores = self._match(words[0])
+        for word in words[1:]:
+            matches = self._match(word)
+            scores = {
+                pk: score + matches[pk]
+                for pk, score in scores.items() if pk in matches
+            }
+        return sorted(scores, key=lambda pk: (-scores[pk], -pk))
+
+
+recipe_index = RecipeIndex()
@@ -0,0 +1,151 @@
+"""Incremental maintenance of the per-user ``ShoppingListItem`` aggregate.
+
+Every row holds the total amount of one ingredient over all recipes in
+the user's shopping cart. The functions below apply the difference
+caused by a cart or recipe change and must run inside the transaction
+that makes the change.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+
+from .models import IngredientsInRecipe, ShoppingCart, ShoppingListItem
+
+
+def get_recipe_amounts(recipe_ids):
+    """Ingredient totals of the given recipes as a ``Counter``."""
+    return Counter(dict(
+        IngredientsInRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .values_list('ingredient_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    ))
+
+
+def apply_deltas(user_ids, deltas):
+    """Add ``deltas`` (ingredient id -> amount) to each user's list."""
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    _apply({
+        (user_id, ingredient_id): delta
+        for user_id in user_ids
+        for ingredient_id, delta in deltas.items()
+    })
+
+
+def _apply(deltas):
+    """Add ``deltas`` ((user id, ingredient id) -> amount) to the
+    list items."""
+    items = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in deltas},
+            ingredient_id__in={ingredient_id for _, ingredient_id in deltas},
+        )
+    }
+    to_create, to_update, to_delete = [], [], []
+    for (user_id, ingredient_id), delta in deltas.items():
+        item = items.get((user_id, ingredient_id))
+        if item is None:
+            if delta > 0:
+                to_create.append(ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    amount=delta,
+                ))
+            continue
+        item.amount += delta
+        if item.amount > 0:
+            to_update.append(item)
+        else:
+            to_delete.append(item.pk)
+    ShoppingListItem.objects.bulk_update(
+        to_update, ['amount'], batch_size=1000
+    )
+    if to_delete:
+        ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+    if not to_create:
+        return
+    try:
+        with transaction.atomic():
+            ShoppingListItem.objects.bulk_create(to_create, batch_size=1000)
+    except IntegrityError:
+        # A concurrent transaction inserted some of the items after the
+        # lookup above: add to them, now that they can be locked.
+        _apply({
+            (item.user_id, item.ingredient_id): item.amount
+            for item in to_create
+        })
+
+
+def add_recipes(user_id, recipe_ids):
+    apply_deltas([user_id], get_recipe_amounts(recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    amounts = get_recipe_amounts(recipe_ids)
+    apply_deltas([user_id], {key: -value for key, value in amounts.items()})
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    """Propagate an ingredient edit to every cart holding the recipe."""
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    apply_deltas(
+        ShoppingCart.objects.filter(recipe_id=recipe_id)
+        .values_list('user_id', flat=True),
+        deltas,
+    )
+
+
+def get_live_totals(user_ids=None):
+    """(user id, ingredient id) -> amount, computed from the carts."""
+    carts = ShoppingCart.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(user_id__in=user_ids)
+    rows = carts.values_list(
+        'user_id', 'recipe__recipeinlist__ingredient_id'
+    ).annotate(
+        total=Sum('recipe__recipeinlist__amount')
+    ).order_by()
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows.iterator()
+        if ingredient_id is not None
+    }
+
+
+def get_stored_totals(user_ids=None):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in items.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ).iterator()
+    }
+
+
+def rebuild(user_ids=None):
+    """Replace the stored aggregate with the live one."""
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    items.delete()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total
+            )
+            for (user_id, ingredient_id), total
+            in get_live_totals(user_ids).items()
+        ),
+        batch_size=5000,
+    )
@@ -0,0 +1,179 @@
+import contextvars
+from contextlib import contextmanager
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import Signal, receiver
+
+from users.models import Follow, User
+
+from . import catalog, counters, feed, search, shopping_list
+from .models import Favorite, Ingredient, Recipe, ShoppingCart
+
+# Models whose files are released when they are replaced or deleted.
+FILE_FIELDS = {
+    Recipe: 'image',
+    User: 'avatar',
+}
+
+COUNTER_FIELDS = {model: field for field, model in counters.COUNTERS.items()}
+
+# Sent with ``user_id``, ``recipe_ids`` and ``created`` after favourites
+# or cart rows of one user were inserted or deleted in bulk, which sends
+# no post_save/post_delete for the rows.
+relations_bulk_changed = Signal()
+
+_changing_in_bulk = contextvars.ContextVar(
+    'relations_changing_in_bulk', default=False
+)
+
+
+@contextmanager
+def changing_in_bulk():
+    """Silence the per-row receivers of favourites and cart rows deleted
+    inside the block; the caller sends ``relations_bulk_changed``."""
+    token = _changing_in_bulk.set(True)
+    try:
+        yield
+    finally:
+        _changing_in_bulk.reset(token)
+
+
+def is_changing_in_bulk():
+    return _changing_in_bulk.get()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def refresh_ingredient_catalog(sender, **kwargs):
+    transaction.on_commit(catalog.bump_version)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'text'} & set(
+        update_fields
+    ):
+        return
+    search.update([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_search(sender, **kwargs):
+    if not search.uses_vectors():
+        transaction.on_commit(search.bump_version)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_added(sender, instance, created, **kwargs):
+    if created:
+        counters.change(COUNTER_FIELDS[sender], [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def count_removed(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Recipe) or is_changing_in_bulk():
+        return
+    counters.change(COUNTER_FIELDS[sender], [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def add_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def fill_timeline(sender, instance, created, **kwargs):
+    if created:
+        feed.follow(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, origin=None, **kwargs):
+    # A deleted user's timeline and recipes go away with the user.
+    if isinstance(origin, User):
+        return
+    feed.unfollow(instance.user_id, instance.following_id)
+
+
+@receiver(relations_bulk_changed, sender=Favorite)
+@receiver(relations_bulk_changed, sender=ShoppingCart)
+def count_bulk_changed(sender, recipe_ids, created, **kwargs):
+    counters.change(COUNTER_FIELDS[sender], recipe_ids, 1 if created else -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        shopping_list.add_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, origin=None, **kwargs):
+    # Deleting a recipe is handled in bulk below; deleting a user drops
+    # the whole list together with the cart.
+    if isinstance(origin, (Recipe, User)) or is_changing_in_bulk():
+        return
+    shopping_list.remove_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(relations_bulk_changed, sender=ShoppingCart)
+def update_shopping_list(sender, user_id, recipe_ids, created, **kwargs):
+    if created:
+        shopping_list.add_recipes(user_id, recipe_ids)
+    else:
+        shopping_list.remove_recipes(user_id, recipe_ids)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    shopping_list.change_recipe(
+        instance.id, shopping_list.get_recipe_amounts([instance.id]), {}
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def remember_stored_file(sender, instance, update_fields=None, **kwargs):
+    field_name = FILE_FIELDS[sender]
+    if instance.pk is None or (
+        update_fields is not None and field_name not in update_fields
+    ):
+        return
+    instance._stored_file_name = sender.objects.filter(
+        pk=instance.pk
+    ).values_list(field_name, flat=True).first()
+    # A new upload takes its own reference even when its bytes, and so
+    # its name, are the same as the old file's.
+    file = getattr(instance, field_name)
+    instance._stored_file_uploaded = bool(file) and not file._committed
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def release_replaced_file(sender, instance, **kwargs):
+    old_name = getattr(instance, '_stored_file_name', None)
+    uploaded = getattr(instance, '_stored_file_uploaded', False)
+    instance._stored_file_name = None
+    instance._stored_file_uploaded = False
+    if old_name and (
+        uploaded or old_name != getattr(instance, FILE_FIELDS[sender]).name
+    ):
+        default_storage.delete(old_name)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def release_deleted_file(sender, instance, **kwargs):
+    name = getattr(instance, FILE_FIELDS[sender]).name
+    if name:
+        default_storage.delete(name)
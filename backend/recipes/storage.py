@@ -0,0 +1,116 @@
+"""Media storage that names files after their contents.
+
+A file is stored as ``<top directory of upload_to>/<ab>/<sha256>.<ext>``,
+so uploading the same bytes twice stores them once. ``StoredFile``
+counts the references to every name: ``save`` adds one, ``delete``
+takes one away, both under a row lock, and the file is removed from
+disk after the last reference is gone and the transaction has
+committed. A new file is likewise written to disk only once the
+transaction that references it commits, so a rolled back upload leaves
+nothing behind. Since a name never changes its contents, the web server
+can cache it forever.
+"""
+import hashlib
+import posixpath
+import re
+from functools import partial
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+HASHED_NAME = re.compile(r'^[^/]+/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME.match(name))
+
+
+def get_digest(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def get_name_digest(name):
+    """The content hash in a hashed ``name``, None for other names."""
+    if not is_hashed(name):
+        return None
+    return posixpath.splitext(posixpath.basename(name))[0]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def __init__(self, *args, **kwargs):
+        # Two uploads of the same bytes racing for a name both write
+        # identical contents, instead of one of them getting another name.
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(*args, **kwargs)
+
+    def get_hashed_name(self, name, content):
+        digest = get_digest(content)
+        directory = name.replace('\\', '/').split('/', 1)[0]
+        extension = posixpath.splitext(name)[1].lower()
+        return f'{directory}/{digest[:2]}/{digest}{extension}'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        with transaction.atomic():
+            stored, created = StoredFile.objects.select_for_update(
+            ).get_or_create(name=name, defaults={'references': 1})
+            if not created:
+                StoredFile.objects.filter(pk=stored.pk).update(
+                    references=F('references') + 1
+                )
+        if not self.exists(name):
+            # The upload may be gone by then, e.g. a closed request file.
+            transaction.on_commit(
+                partial(self.save_missing, name, self.copy(content))
+            )
+        return name
+
+    @staticmethod
+    def copy(content):
+        copy = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        for chunk in content.chunks():
+            copy.write(chunk)
+        content.seek(0)
+        return File(copy)
+
+    def save_missing(self, name, content):
+        with content:
+            if not self.exists(name):
+                self._save(name, content)
+
+    def delete(self, name):
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(
+                name=name
+            ).first()
+            if stored is not None and stored.references > 1:
+                stored.references = F('references') - 1
+                stored.save(update_fields=['references'])
+                return
+            if stored is not None:
+                stored.delete()
+        # Files saved before this storage have no counter and only ever
+        # had one reference.
+        transaction.on_commit(partial(self.delete_unreferenced, name))
+
+    def delete_unreferenced(self, name):
+        # The same bytes may have been uploaded again in the meantime.
+        if not StoredFile.objects.filter(name=name).exists():
+            super().delete(name)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_fan_in',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Рецепты в ленту подписчиков собираются при чтении'),
+        ),
+    ]
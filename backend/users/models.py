@@ -24,6 +24,14 @@ class User(AbstractUser):
         upload_to='users/', null=True, blank=True,
         verbose_name='Аватар'
     )
+    avatar_variants = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name='Уменьшенные копии аватара'
+    )
+    feed_fan_in = models.BooleanField(
+        default=False, editable=False,
+        verbose_name='Рецепты в ленту подписчиков собираются при чтении'
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']